@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# Benchmarks for Q-Paks against a fake flatpak and synthetic catalogs, run under offscreen Qt
+# Usage: python3 benchmarks/bench.py [--sizes 100,3000,30000] [--delay 0.05] [--output results.json]
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCES_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), "sources")
+
+WORDS = [
+    "audio", "video", "photo", "music", "editor", "player", "browser", "mail", "chat", "office",
+    "paint", "text", "code", "terminal", "notes", "maps", "weather", "clock", "game", "chess",
+    "camera", "scanner", "calendar", "contacts", "podcast", "radio", "torrent", "backup", "password", "vpn",
+]
+LICENSES = ["GPL-3.0-or-later", "MIT", "Apache-2.0", "LicenseRef-proprietary", "MPL-2.0"]
+QUERIES = ["a", "video", "text edit", "firefox", "vidoe", "zzzz"]
+
+# Function to write a synthetic appstream file with the given number of apps, returning their IDs in order
+def write_catalog(path, size):
+    app_ids = []
+    rng = random.Random(size)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write("<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n<components version=\"0.8\" origin=\"flathub\">\n")
+        for i in range(size):
+            first, second, third = rng.sample(WORDS, 3)
+            app_id = f"org.{first}.{second.capitalize()}{i}"
+            app_ids.append(app_id)
+            f.write(
+                f"<component type=\"desktop-application\"><id>{app_id}</id>"
+                f"<name>{first.capitalize()} {second.capitalize()} {i}</name><name xml:lang=\"de\">{first}</name>"
+                f"<summary>A {third} {second} for your desktop</summary>"
+                f"<description><p>{first.capitalize()} {second} is a {third} app.</p></description>"
+                f"<project_license>{rng.choice(LICENSES)}</project_license>"
+                f"<bundle type=\"flatpak\">app/{app_id}/x86_64/stable</bundle>"
+                f"<keywords><keyword>{third}</keyword></keywords><categories><category>Utility</category></categories>"
+                f"<custom><value key=\"flathub::verification::verified\">{'true' if rng.random() < 0.4 else 'false'}</value></custom>"
+                f"<releases><release version=\"1.{i}\" timestamp=\"1700000000\"/></releases>"
+                f"</component>\n"
+            )
+        f.write("</components>\n")
+    return app_ids
+
+# Function to set up a home directory with a fake flatpak, a catalog and some installed apps
+def make_environment(root, size, installed, delay):
+    bin_dir = os.path.join(root, "bin")
+    os.makedirs(bin_dir)
+    os.symlink(os.path.join(BENCHMARKS_DIR, "fake-flatpak"), os.path.join(bin_dir, "flatpak"))
+
+    env = dict(os.environ)
+    env.update({
+        "HOME": os.path.join(root, "home"),
+        "XDG_DATA_HOME": os.path.join(root, "home", ".local", "share"),
+        "XDG_CACHE_HOME": os.path.join(root, "home", ".cache"),
+        "XDG_RUNTIME_DIR": os.path.join(root, "runtime"),
+        "FLATPAK_SYSTEM_DIR": os.path.join(root, "system"),
+        "PATH": bin_dir + os.pathsep + env.get("PATH", ""),
+        "QT_QPA_PLATFORM": "offscreen",
+        "QPAKS_BACKEND": "cli",
+        "FAKE_FLATPAK_DELAY": str(delay),
+    })
+    os.makedirs(env["XDG_RUNTIME_DIR"], mode=0o700)
+    os.makedirs(env["FLATPAK_SYSTEM_DIR"])
+
+    installation = os.path.join(env["XDG_DATA_HOME"], "flatpak")
+    catalog_ids = write_catalog(os.path.join(installation, "appstream", "flathub", "x86_64", "active", "appstream.xml"), size)
+    with open(os.path.join(installation, "remotes"), "w") as f:
+        f.write("flathub\n")
+
+    # Deploy a slice of the catalog as installed apps
+    app_ids = catalog_ids[:installed]
+    if app_ids:
+        subprocess.run([os.path.join(bin_dir, "flatpak"), "install", "--user", "flathub"] + app_ids, env=dict(env, FAKE_FLATPAK_DELAY="0"), stdout=subprocess.DEVNULL, check=True)
+    return env
+
+# Function to wait in the Qt event loop until a condition holds, returning the time it took in ms
+def wait_until(app, condition, timeout=60):
+    start = time.monotonic()
+    while not condition():
+        app.processEvents()
+        if time.monotonic() - start > timeout:
+            raise TimeoutError("benchmark condition not reached")
+        time.sleep(0.001)
+    return (time.monotonic() - start) * 1000
+
+# Function to run the measurements for one catalog, in a fresh process set up by make_environment
+def worker():
+    sys.path.insert(0, SOURCES_DIR)
+    import main
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication([sys.argv[0]])
+    metrics = {}
+
+    window = main.QPaksWindow(app)
+    wait_until(app, lambda: window.first_paint_ms is not None)
+    metrics["time_to_first_paint_ms"] = window.first_paint_ms
+
+    # Time from process start until the installed apps are listed, then for a refresh with nothing changed
+    installed_apps = window.installed_apps
+    wait_until(app, lambda: installed_apps.t is None and not installed_apps.placeholder.text().startswith("Loading"))
+    metrics["installed_first_load_ms"] = (time.monotonic() - main.START_TIME) * 1000
+    wait_until(app, lambda: not window.remotes_thread.isRunning())
+    installed_apps.update()
+    metrics["installed_refresh_ms"] = wait_until(app, lambda: installed_apps.t is None)
+    metrics["installed_apps"] = len(installed_apps.widgets)
+
+    start = time.monotonic()
+    main.catalog.refresh()
+    metrics["catalog_build_ms"] = (time.monotonic() - start) * 1000
+    metrics["catalog_apps"] = len(main.catalog.apps)
+
+    # Time searches from the moment the search starts until the results are in the view
+    window.install_button_clicked()
+    dialog = window.search_dialog
+    metrics["search"] = {}
+    for query in QUERIES:
+        dialog.input.blockSignals(True)
+        dialog.input.setText(query)
+        dialog.input.blockSignals(False)
+
+        start = time.monotonic()
+        dialog.search_clicked()
+        wait_until(app, lambda: dialog.t is None)
+        search_ms = (time.monotonic() - start) * 1000
+
+        start = time.monotonic()
+        dialog.results_view.viewport().repaint()
+        render_ms = (time.monotonic() - start) * 1000
+        metrics["search"][query] = {"latency_ms": search_ms, "render_ms": render_ms, "results": dialog.results_model.rowCount()}
+
+    dialog.done(0)
+    window.close()
+    metrics["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    json.dump(metrics, sys.stdout)
+
+# Function to get the revision of the tree being benchmarked, if it is a git checkout
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=BENCHMARKS_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Q-Paks against a fake flatpak")
+    parser.add_argument("--sizes", default="100,3000,30000", help="comma separated catalog sizes")
+    parser.add_argument("--installed", type=int, default=100, help="maximum number of installed apps")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds added to every flatpak call")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker()
+        return
+
+    results = []
+    for size in [int(size) for size in args.sizes.split(",")]:
+        root = tempfile.mkdtemp(prefix="q-paks-bench-")
+        try:
+            env = make_environment(root, size, min(args.installed, size), args.delay)
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker"], env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+            results.append({"catalog_size": size, "flatpak_delay_s": args.delay, **json.loads(out.decode().strip().splitlines()[-1])})
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
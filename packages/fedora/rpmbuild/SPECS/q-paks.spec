@@ -25,11 +25,16 @@ Q-Paks is a fork of Qubes Apps by Micah F Lee, an application for searching, ins
 mkdir -p %{buildroot}%{_bindir}
 install -m 0755 main.py %{buildroot}%{_bindir}/q-paks
 
+mkdir -p %{buildroot}%{_prefix}/lib/q-paks
+install -m 0644 qpaks.py qpaks_gui.py %{buildroot}%{_prefix}/lib/q-paks/
+%py_byte_compile %{python3} %{buildroot}%{_prefix}/lib/q-paks
+
 mkdir -p %{buildroot}%{_datadir}/applications/
 install -m 0644 q-paks.desktop %{buildroot}%{_datadir}/applications/q-paks.desktop
 
 %files
 %{_bindir}/q-paks
+%{_prefix}/lib/q-paks/
 %{_datadir}/applications/q-paks.desktop
 
 %changelog
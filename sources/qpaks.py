@@ -0,0 +1,2381 @@
+# Core of Q-Paks, which searches, installs, removes and updates Flatpak apps without Qt, for the window and the subcommands
+import time
+START_TIME = time.monotonic()  # Taken first thing, to measure the time to first paint
+import argparse
+import subprocess
+import sys
+import os
+import json
+import glob
+import gzip
+import re
+import threading
+import configparser
+import html
+import mmap
+import gc
+import bisect
+import itertools
+import operator
+import collections
+import hashlib
+import shutil
+import marshal
+import struct
+import atexit
+import contextlib
+import xml.etree.ElementTree as ET
+
+# Collects the timings of external commands and hot paths, reported on exit when profiling is enabled
+# Enable it with QPAKS_PROFILE=1 or --profile, and QPAKS_PROFILE_TRACE=<path> or --profile-trace=<path> also writes a Chrome trace
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.trace_path = None
+        self.lock = threading.Lock()
+        self.events = []  # (name, category, start, duration, thread, args) with times in seconds
+
+    # Turn profiling on from the environment and command line, removing the profiling flags from argv
+    def configure(self, argv):
+        self.enabled = os.environ.get("QPAKS_PROFILE") == "1"
+        self.trace_path = os.environ.get("QPAKS_PROFILE_TRACE")
+        for arg in list(argv[1:]):
+            if arg == "--profile":
+                self.enabled = True
+                argv.remove(arg)
+            elif arg.startswith("--profile-trace="):
+                self.trace_path = arg[len("--profile-trace="):]
+                argv.remove(arg)
+        if self.trace_path:
+            self.enabled = True
+        if self.enabled:
+            atexit.register(self.report)
+
+    # Record an event that already happened
+    def record(self, name, category, start, duration, **args):
+        if self.enabled:
+            with self.lock:
+                self.events.append((name, category, start, duration, threading.get_ident(), args))
+
+    # Time the code run inside a with block
+    @contextlib.contextmanager
+    def span(self, name, category="stage", **args):
+        if not self.enabled:
+            yield
+            return
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(name, category, start, time.monotonic() - start, **args)
+
+    # Run a command like subprocess.check_output, recording its duration, output size and exit code
+    def check_output(self, cmd):
+        start = time.monotonic()
+        stdout_bytes, returncode = 0, None
+        try:
+            out = subprocess.check_output(cmd)
+            stdout_bytes, returncode = len(out), 0
+            return out
+        except subprocess.CalledProcessError as e:
+            stdout_bytes, returncode = len(e.output or b""), e.returncode
+            raise
+        finally:
+            self.record(" ".join(cmd[:2]), "command", start, time.monotonic() - start, command=" ".join(cmd), stdout_bytes=stdout_bytes, exit_code=returncode)
+
+    # Run a command like subprocess.run with check=True, recording its duration and exit code
+    def run(self, cmd):
+        start = time.monotonic()
+        returncode = None
+        try:
+            returncode = subprocess.run(cmd, check=True).returncode
+        except subprocess.CalledProcessError as e:
+            returncode = e.returncode
+            raise
+        finally:
+            self.record(" ".join(cmd[:2]), "command", start, time.monotonic() - start, command=" ".join(cmd), stdout_bytes=0, exit_code=returncode)
+
+    # Print a summary table of the events, and write the Chrome trace if asked to
+    def report(self):
+        with self.lock:
+            events = list(self.events)
+
+        totals = {}
+        for name, category, start, duration, thread, args in events:
+            total = totals.setdefault((category, name), {"count": 0, "total": 0.0, "max": 0.0, "bytes": 0, "failures": 0})
+            total["count"] += 1
+            total["total"] += duration
+            total["max"] = max(total["max"], duration)
+            total["bytes"] += args.get("stdout_bytes", 0)
+            if category == "command" and args.get("exit_code") != 0:
+                total["failures"] += 1
+
+        print(f"\n{'Category':<10} {'Name':<32} {'Count':>6} {'Total ms':>10} {'Mean ms':>9} {'Max ms':>9} {'Stdout':>9} {'Failed':>6}")
+        for (category, name), total in sorted(totals.items(), key=lambda item: -item[1]["total"]):
+            print(f"{category:<10} {name[:32]:<32} {total['count']:>6} {total['total'] * 1000:>10.1f} {total['total'] * 1000 / total['count']:>9.1f} {total['max'] * 1000:>9.1f} {total['bytes']:>9} {total['failures']:>6}")
+
+        if self.trace_path:
+            trace_events = []
+            for name, category, start, duration, thread, args in events:
+                trace_events.append({
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": (start - START_TIME) * 1e6,
+                    "dur": duration * 1e6,
+                    "pid": os.getpid(),
+                    "tid": thread,
+                    "args": args,
+                })
+            try:
+                with open(self.trace_path, "w") as f:
+                    json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+                print(f"Wrote trace to {self.trace_path}")
+            except OSError as e:
+                print(f"Failed to write trace to '{self.trace_path}': {e}")
+
+profiler = Profiler()
+
+# Flathub remotes restricted to a subset of apps. Labels are derived from the metadata of the main flathub
+# remote, so these only get added when QPAKS_SUBSET_REMOTES=1 is set, to avoid storing the same appstream four times
+SUBSET_REMOTES = [
+    ("flathub-floss", "https://flathub.org/repo/flathub.flatpakrepo", "--subset=floss"),
+    ("flathub-verified_floss", "https://flathub.org/repo/flathub.flatpakrepo", "--subset=verified_floss"),
+    ("flathub-verified", "https://flathub.org/repo/flathub.flatpakrepo", "--subset=verified"),
+]
+
+# Function to add Flatpak remotes if they don't already exist
+def add_flatpak_remotes():
+    remotes = [
+        ("flathub", "https://flathub.org/repo/flathub.flatpakrepo", ""),
+    ]
+    if os.environ.get("QPAKS_SUBSET_REMOTES") == "1":
+        remotes += SUBSET_REMOTES
+
+    try:
+        # Retrieve the list of existing remotes for the user
+        existing_remotes = get_backend().list_remotes()
+    except FlatpakError as e:
+        print(f"Failed to retrieve existing remotes: {e}")
+        existing_remotes = []
+
+    # Loop through the remotes that need to be added
+    for name, url, subset in remotes:
+        if name in existing_remotes:
+            print(f"Remote '{name}' already exists. Skipping addition.")
+            continue  # Skip adding this remote since it already exists
+
+        try:
+            # Add the remote if it does not already exist
+            get_backend().add_remote(name, url, subset)
+            print(f"Remote '{name}' added.")
+        except FlatpakError as e:
+            print(f"Failed to add remote '{name}': {e}")
+
+
+# Function to validate that an app is not a core system package (e.g., Freedesktop, Gnome, KDE)
+def valid_package(app_id):
+    if (
+        app_id.startswith("org.freedesktop.")
+        or app_id.startswith("org.gnome.")
+        or app_id.startswith("org.kde.")
+        or app_id == ""
+    ):
+        return False
+    return True
+
+# Flatpak app IDs are reverse DNS names of at least three elements, and only the last one may contain dashes
+APP_ID_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)+\.[A-Za-z_][A-Za-z0-9_-]*")
+
+# Function to check that a string is a valid Flatpak app ID
+def valid_app_id(app_id):
+    return len(app_id) <= 255 and APP_ID_RE.fullmatch(app_id) is not None
+
+# Function to get the path of the user's Flatpak installation
+def user_installation_path():
+    if os.environ.get("FLATPAK_USER_DIR"):
+        return os.environ["FLATPAK_USER_DIR"]
+    data_home = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    return os.path.join(data_home, "flatpak")
+
+# Function to get the path of the system-wide Flatpak installation
+def system_installation_path():
+    return os.environ.get("FLATPAK_SYSTEM_DIR") or "/var/lib/flatpak"
+
+# Function to get the local repos flatpak should take objects from before downloading them, from QPAKS_SIDELOAD_REPOS
+# It's a colon separated list of directories made by `flatpak create-usb` (or `q-paks export`), or of OSTree repos
+def sideload_repos():
+    repos = []
+    for directory in os.environ.get("QPAKS_SIDELOAD_REPOS", "").split(":"):
+        if not directory:
+            continue
+        for repo in (os.path.join(directory, ".ostree", "repo"), os.path.join(directory, "ostree", "repo"), directory):
+            if os.path.isfile(os.path.join(repo, "config")):
+                repos.append(repo)
+                break
+        else:
+            print(f"Ignoring the sideload repo '{directory}', it has no OSTree repo")
+    return repos
+
+# Sections of the metadata of an app holding its sandbox permissions, and how they are shown
+METADATA_PERMISSIONS = [
+    ("Context", None),
+    ("Session Bus Policy", "Session bus"),
+    ("System Bus Policy", "System bus"),
+]
+
+# Function to get the runtime and the sandbox permissions from the metadata of an app, in the key file format flatpak uses
+def metadata_details(metadata):
+    parser = configparser.ConfigParser(interpolation=None, strict=False)
+    parser.optionxform = str
+    try:
+        parser.read_string(metadata)
+    except configparser.Error as e:
+        print(f"Failed to parse app metadata: {e}")
+        return {"runtime": "", "permissions": []}
+
+    permissions = []
+    for section, title in METADATA_PERMISSIONS:
+        if not parser.has_section(section):
+            continue
+        for key, value in parser.items(section):
+            if title is None:
+                permissions.append(f"{key}: {', '.join(v for v in value.split(';') if v)}")
+            else:
+                permissions.append(f"{title}: {key} ({value})")
+    return {"runtime": parser.get("Application", "runtime", fallback=""), "permissions": permissions}
+
+# Function to get the runtime and the extension points from the metadata of an app or runtime, which name the runtimes it needs
+def metadata_dependencies(metadata):
+    parser = configparser.ConfigParser(interpolation=None, strict=False)
+    parser.optionxform = str
+    try:
+        parser.read_string(metadata)
+    except configparser.Error as e:
+        print(f"Failed to parse metadata: {e}")
+        return "", []
+    extensions = [section[len("Extension "):] for section in parser.sections() if section.startswith("Extension ")]
+    return parser.get("Application", "runtime", fallback=""), extensions
+
+# Function to get the directory flatpak keeps the data of the user's apps in
+def app_data_path():
+    return os.path.join(os.path.expanduser("~"), ".var", "app")
+
+# Function to delete the data removed apps left in the user's home, reporting it as the status of a job
+# The installed apps are listed again first, so no data is deleted for an app installed since it was found, or in another installation
+def delete_app_data(backend, app_ids, progress_callback):
+    try:
+        installed = {app[0] for app in backend.list_installed()}
+    except FlatpakError as e:
+        progress_callback(100, f"Failed to check the installed apps before deleting their data: {e}")
+        return False
+    for app_id in app_ids:
+        if app_id in installed:
+            progress_callback(100, f"Keeping the data of {app_id}, which is installed")
+            continue
+        progress_callback(100, f"Deleting the data of {app_id}")
+        try:
+            shutil.rmtree(os.path.join(app_data_path(), app_id))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            progress_callback(100, f"Failed to delete the data of {app_id}: {e}")
+            return False
+    return True
+
+# Error raised by the flatpak backends when flatpak fails
+class FlatpakError(Exception):
+    pass
+
+# Interface to flatpak shared by the backends, implemented by running the flatpak command line tool
+class CliBackend:
+    name = "cli"
+
+    # Run a flatpak command and return its output
+    def run(self, args):
+        try:
+            return profiler.check_output(["flatpak"] + args).decode()
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise FlatpakError(str(e))
+
+    # Return the names of the user's remotes
+    def list_remotes(self):
+        remotes = []
+        for line in self.run(["remotes", "--user"]).strip().split("\n"):
+            split_line = line.split()
+            if len(split_line) > 0:  # Ensure there is at least one element after split
+                remotes.append(split_line[0])  # Append the remote name to the list
+        return remotes
+
+    # Add a remote for the user from a .flatpakrepo URL, optionally restricted to a subset of its apps
+    def add_remote(self, name, url, subset=""):
+        cmd = ["remote-add", "--if-not-exists", "--user"]
+        if subset:
+            cmd.append(subset)
+        self.run(cmd + [name, url])
+
+    # Return the installed apps as (id, name, installation) tuples
+    def list_installed(self):
+        apps = []
+        out = self.run(["list", "--app", "--columns=application,name,installation"])
+        for line in out.strip().split("\n"):
+            if line:
+                parts = line.split("\t")
+                if len(parts) == 3:
+                    apps.append(tuple(parts))
+        return apps
+
+    # Search the remotes' appstream metadata, returning (id, name, remotes) tuples
+    def search(self, query):
+        apps = []
+        out = self.run(["search", "--columns=application,name,remotes", query])
+        if "No matches found" in out:
+            return apps
+
+        for line in out.strip().split("\n"):
+            parts = line.split("\t")
+            if len(parts) >= 3:
+                apps.append((parts[0].strip(), parts[1].strip(), parts[2].strip().split(",")))
+        return apps
+
+    # Return the installed refs of an installation that have updates in their remote, as (id, ref, download size) tuples
+    def list_updates(self, installation):
+        updates = []
+        out = self.run(["remote-ls", "--updates", f"--{installation}", "--columns=application,ref,download-size"])
+        for line in out.strip().split("\n"):
+            parts = line.split("\t")
+            if len(parts) == 3:
+                updates.append((parts[0].strip(), parts[1].strip(), parse_size(parts[2].strip()) or 0))
+        return updates
+
+    # Return the download and installed size, the runtime and the permissions of a ref in a remote
+    def remote_info(self, remote, ref):
+        info = {}
+        for line in self.run(["remote-info", "--user", remote, ref]).split("\n"):
+            key, _, value = line.partition(":")
+            info[key.strip()] = value.strip()
+
+        details = metadata_details(self.run(["remote-info", "--user", "--show-metadata", remote, ref]))
+        details["download_size"] = info.get("Download", "")
+        details["installed_size"] = info.get("Installed", "")
+        return details
+
+    # Download the latest appstream metadata of the user's remotes
+    def update_appstream(self):
+        try:
+            profiler.run(["flatpak", "update", "--appstream", "--user"])
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise FlatpakError(str(e))
+
+    # Start an installed app
+    def launch(self, app_id, installation):
+        try:
+            with profiler.span("flatpak run", "command", command=f"flatpak run --{installation} {app_id}"):
+                subprocess.Popen(["flatpak", "run", f"--{installation}", app_id])
+        except OSError as e:
+            raise FlatpakError(str(e))
+
+    # Copy installed apps and the runtimes they need into a directory other machines can install them from
+    def create_usb(self, installation, directory, app_ids):
+        self.run(["create-usb", f"--{installation}", directory] + app_ids)
+
+    # Get the flatpak commands carrying out a job
+    # The command line tool can't mix installs and uninstalls, so a sync takes a command for each remote and action
+    # Installs and updates take what they can from the sideload repos, and only download what is missing from them
+    def transaction_commands(self, job):
+        sideload = [f"--sideload-repo={repo}" for repo in sideload_repos()]
+
+        def command(action):
+            return ["flatpak", action, f"--{job.installation}", "--noninteractive", "-y"] + (sideload if action != "uninstall" else [])
+
+        if job.action == "install":
+            return [command("install") + [job.remote] + job.refs]
+        if job.action == "cleanup":
+            return [command("uninstall") + ["--unused"]]
+        if job.action != "sync":
+            return [command(job.action) + job.refs]
+
+        commands = []
+        remotes = {}
+        for app_id in job.refs:
+            remotes.setdefault(job.remotes.get(app_id, job.remote), []).append(app_id)
+        for remote, app_ids in remotes.items():
+            commands.append(command("install") + [remote] + app_ids)
+        if job.removals:
+            commands.append(command("uninstall") + job.removals)
+        for app_id, commit in job.commits.items():
+            commands.append(command("update") + [f"--commit={commit}", app_id])
+        return commands
+
+    # Run the install, uninstall, update or sync transaction of a job, reporting progress as (percent, status)
+    # Returns whether it succeeded, and can be stopped by calling job.abort() from another thread
+    def run_transaction(self, job, progress_callback):
+        commands = self.transaction_commands(job)
+        for i, cmd in enumerate(commands):
+            if job.cancelled:
+                return False
+            # Spread the progress of each command over the whole job
+            if not self.run_command(cmd, job, lambda progress, status, i=i: progress_callback((i * 100 + progress) // len(commands), status)):
+                return False
+        if job.action == "cleanup":
+            return delete_app_data(self, job.refs, progress_callback)
+        return True
+
+    # Run one flatpak command of a job, reporting its progress
+    def run_command(self, cmd, job, progress_callback):
+        start = time.monotonic()
+        try:
+            process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        except OSError as e:
+            progress_callback(0, str(e))
+            return False
+
+        job.abort = process.terminate
+        # The job may have been cancelled before the process existed
+        if job.cancelled:
+            process.terminate()
+
+        # flatpak redraws its progress with carriage returns, so split on those as well as newlines
+        buffer = b""
+        progress = 0
+        stdout_bytes = 0
+        while True:
+            chunk = os.read(process.stdout.fileno(), 4096)
+            if not chunk:
+                break
+            stdout_bytes += len(chunk)
+            buffer += chunk
+            lines = re.split(rb"[\r\n]", buffer)
+            buffer = lines.pop()
+            for line in lines:
+                line = line.decode(errors="replace").strip()
+                if line:
+                    progress = parse_progress(line) or progress
+                    progress_callback(progress, line)
+
+        process.stdout.close()
+        returncode = process.wait()
+        profiler.record(" ".join(cmd[:2]), "command", start, time.monotonic() - start, command=" ".join(cmd), stdout_bytes=stdout_bytes, exit_code=returncode)
+        return returncode == 0
+
+# Backend calling libflatpak in-process through GObject introspection, keeping the installation handles open
+# Anything libflatpak has no API for, like searching, still goes through the command line tool
+class LibFlatpakBackend(CliBackend):
+    name = "libflatpak"
+
+    def __init__(self):
+        import gi
+        gi.require_version("Flatpak", "1.0")
+        from gi.repository import Flatpak, Gio, GLib
+        self.Flatpak = Flatpak
+        self.Gio = Gio
+        self.GLib = GLib
+        self.installations = {
+            "user": Flatpak.Installation.new_user(None),
+            "system": Flatpak.Installation.new_system(None),
+        }
+        # Extra system installations configured in /etc/flatpak/installations.d are known by their ID
+        try:
+            for installation in Flatpak.get_system_installations(None):
+                if installation.get_id() not in ("default", "user"):
+                    self.installations.setdefault(installation.get_id(), installation)
+        except GLib.Error:
+            pass
+
+    def list_remotes(self):
+        try:
+            return [remote.get_name() for remote in self.installations["user"].list_remotes(None)]
+        except self.GLib.Error as e:
+            raise FlatpakError(e.message)
+
+    def add_remote(self, name, url, subset=""):
+        # Subsets can't be set through libflatpak
+        if subset:
+            return super(LibFlatpakBackend, self).add_remote(name, url, subset)
+
+        # Imported here as it's slow to import and only needed when adding a remote
+        import urllib.request
+
+        try:
+            with urllib.request.urlopen(url, timeout=60) as f:
+                remote = self.Flatpak.Remote.new_from_file(name, self.GLib.Bytes.new(f.read()))
+            self.installations["user"].add_remote(remote, True, None)
+        except OSError as e:
+            raise FlatpakError(str(e))
+        except self.GLib.Error as e:
+            raise FlatpakError(e.message)
+
+    def list_installed(self):
+        apps = []
+        for installation_name, installation in self.installations.items():
+            try:
+                refs = installation.list_installed_refs_by_kind(self.Flatpak.RefKind.APP, None)
+            except self.GLib.Error as e:
+                raise FlatpakError(e.message)
+            for ref in refs:
+                apps.append((ref.get_name(), ref.get_appdata_name() or ref.get_name(), installation_name))
+        return apps
+
+    def update_appstream(self):
+        installation = self.installations["user"]
+        try:
+            for remote in installation.list_remotes(None):
+                if not remote.get_disabled():
+                    with profiler.span("libflatpak update appstream", "libflatpak", remote=remote.get_name()):
+                        installation.update_appstream_sync(remote.get_name(), None, None)
+        except self.GLib.Error as e:
+            raise FlatpakError(e.message)
+
+    def list_updates(self, installation):
+        installation = self.installations[installation]
+        updates = []
+        try:
+            with profiler.span("libflatpak list updates", "libflatpak"):
+                for ref in installation.list_installed_refs_for_update(None):
+                    remote_ref = installation.fetch_remote_ref_sync(ref.get_origin(), ref.get_kind(), ref.get_name(), ref.get_arch(), ref.get_branch(), None)
+                    updates.append((ref.get_name(), ref.format_ref(), remote_ref.get_download_size()))
+        except self.GLib.Error as e:
+            raise FlatpakError(e.message)
+        return updates
+
+    def remote_info(self, remote, ref):
+        kind, name, arch, branch = (ref.split("/") + ["", "", ""])[:4]
+        try:
+            with profiler.span("libflatpak remote info", "libflatpak", ref=ref):
+                remote_ref = self.installations["user"].fetch_remote_ref_sync(
+                    remote, self.Flatpak.RefKind.APP, name or ref, arch or self.Flatpak.get_default_arch(), branch or "stable", None)
+        except self.GLib.Error as e:
+            raise FlatpakError(e.message)
+
+        details = metadata_details(remote_ref.get_metadata().get_data().decode())
+        details["download_size"] = self.GLib.format_size(remote_ref.get_download_size())
+        details["installed_size"] = self.GLib.format_size(remote_ref.get_installed_size())
+        return details
+
+    def launch(self, app_id, installation):
+        try:
+            self.installations[installation].launch(app_id, None, None, None, None)
+        except self.GLib.Error as e:
+            raise FlatpakError(e.message)
+
+    # Get the full ref of an installed app, like app/org.example.App/x86_64/stable
+    def installed_ref(self, installation, app_id):
+        # A branch of None would mean master, so the current branch is looked up instead, which is stable for Flathub apps
+        return installation.get_current_installed_app(app_id, None).format_ref()
+
+    def run_transaction(self, job, progress_callback):
+        installation = self.installations[job.installation]
+        cancellable = self.Gio.Cancellable()
+        job.abort = cancellable.cancel
+        if job.cancelled:
+            return False
+
+        if job.action == "cleanup":
+            # An empty transaction fails, so it only runs when flatpak finds something unused
+            try:
+                unused = [ref.format_ref() for ref in installation.list_unused_refs(None, cancellable)]
+            except self.GLib.Error as e:
+                progress_callback(0, e.message)
+                return False
+
+            def uninstall_unused(transaction):
+                for ref in unused:
+                    transaction.add_uninstall(ref)
+
+            if unused and not self.run_operations(installation, job, cancellable, progress_callback, uninstall_unused):
+                return False
+            return delete_app_data(self, job.refs, progress_callback)
+
+        def add_operations(transaction):
+            arch = self.Flatpak.get_default_arch()
+            if job.action in ("install", "sync"):
+                for app_id in job.refs:
+                    transaction.add_install(job.remotes.get(app_id, job.remote), f"app/{app_id}/{arch}/stable", None)
+            if job.action in ("uninstall", "sync"):
+                for app_id in job.refs if job.action == "uninstall" else job.removals:
+                    transaction.add_uninstall(self.installed_ref(installation, app_id))
+            if job.action == "sync":
+                for app_id, commit in job.commits.items():
+                    if app_id not in job.refs:
+                        transaction.add_update(self.installed_ref(installation, app_id), None, commit)
+            elif job.action == "update":
+                refs = [self.installed_ref(installation, app_id) for app_id in job.refs]
+                if not refs:
+                    refs = [ref.format_ref() for ref in installation.list_installed_refs_for_update(cancellable)]
+                for ref in refs:
+                    transaction.add_update(ref, None, None)
+
+        # Apps a sync installs can only be moved to their pinned commit once they are installed
+        def pin_installed(transaction):
+            for app_id, commit in job.commits.items():
+                if app_id in job.refs:
+                    transaction.add_update(self.installed_ref(installation, app_id), None, commit)
+
+        if not self.run_operations(installation, job, cancellable, progress_callback, add_operations):
+            return False
+        if job.action == "sync" and any(app_id in job.refs for app_id in job.commits):
+            return self.run_operations(installation, job, cancellable, progress_callback, pin_installed)
+        return True
+
+    # Run a libflatpak transaction with the operations added by add_operations
+    def run_operations(self, installation, job, cancellable, progress_callback, add_operations):
+        try:
+            transaction = self.Flatpak.Transaction.new_for_installation(installation, cancellable)
+            for repo in sideload_repos():
+                transaction.add_sideload_repo(repo)
+            add_operations(transaction)
+        except self.GLib.Error as e:
+            progress_callback(0, e.message)
+            return False
+
+        # Report each operation's progress as a share of the whole transaction, like the CLI does
+        def new_operation(transaction, operation, progress):
+            operations = transaction.get_operations()
+            current = next((i for i, o in enumerate(operations) if o.get_ref() == operation.get_ref()), 0)
+            operation_type = self.Flatpak.transaction_operation_type_to_string(operation.get_operation_type())
+            status = f"{operation_type.capitalize()} {operation.get_ref()} {current + 1}/{len(operations)}"
+
+            def changed(progress):
+                progress_callback((current * 100 + progress.get_progress()) // len(operations), status)
+
+            progress.set_update_frequency(200)
+            progress.connect("changed", changed)
+            changed(progress)
+
+        def operation_error(transaction, operation, error, details):
+            progress_callback(0, error.message)
+            return False  # Stop the transaction
+
+        transaction.connect("new-operation", new_operation)
+        transaction.connect("operation-error", operation_error)
+        # Only the configured remotes are used, flatpak must not ask which remote to pick
+        transaction.connect("choose-remote-for-ref", lambda transaction, ref, runtime_ref, remotes: 0)
+
+        try:
+            with profiler.span(f"libflatpak {job.action}", "libflatpak", refs=" ".join(job.refs)):
+                transaction.run(cancellable)
+        except self.GLib.Error as e:
+            progress_callback(0, e.message)
+            return False
+        return True
+
+# Function to pick the fastest backend available, QPAKS_BACKEND=cli or QPAKS_BACKEND=libflatpak forces one
+def load_backend():
+    if os.environ.get("QPAKS_BACKEND", "libflatpak") == "libflatpak":
+        try:
+            return LibFlatpakBackend()
+        except (ImportError, ValueError) as e:
+            print(f"libflatpak is not available, using the flatpak command: {e}")
+        except Exception as e:
+            # GLib.Error can't be named without gi, which may be missing
+            print(f"Failed to open the Flatpak installations, using the flatpak command: {e}")
+    return CliBackend()
+
+backend_lock = threading.Lock()
+backend = None
+
+# Function to get the backend shared by the whole application
+def get_backend():
+    global backend
+    with backend_lock:
+        if backend is None:
+            backend = load_backend()
+            print(f"Using the {backend.name} backend")
+        return backend
+
+# Function to find the appstream files already downloaded by flatpak, as (remote, path) pairs
+def find_appstream_files():
+    files = []
+    for installation in (user_installation_path(), system_installation_path()):
+        pattern = os.path.join(installation, "appstream", "*", "*", "active")
+        for active_dir in sorted(glob.glob(pattern)):
+            remote = active_dir.split(os.sep)[-3]
+            # Prefer the uncompressed copy, it is quicker to parse than the gzipped one
+            for filename in ("appstream.xml", "appstream.xml.gz"):
+                path = os.path.join(active_dir, filename)
+                if os.path.isfile(path):
+                    files.append((remote, path))
+                    break
+    return files
+
+# Function to split text into lowercase words for the search index
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+# Function to get the trigrams of a word, padded so the start and end of the word count as trigrams too
+def trigrams(word):
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+# Function to get the optimal string alignment distance of two words, or limit + 1 once it exceeds the limit
+def edit_distance(a, b, limit):
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+# Scores of a query word matching a word at the start of the name, in the name, in the application ID or in the other text of an app,
+# when the query word is the whole word, the start of it or elsewhere in it. Fuzzy matches score like whole words scaled by their similarity
+MATCH_SCORES = {
+    "start": (100, 100, 0),
+    "name": (90, 80, 60),
+    "id": (70, 60, 45),
+    "text": (30, 30, 20),
+}
+QUERY_PREFIX_BONUS = 50  # The whole query starts the name, like "text edit" for "Text Editor"
+
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+
+# Function to get the untranslated text of a child element of an appstream component
+def appstream_text(component, tag):
+    for element in component.findall(tag):
+        if element.get(XML_LANG) is None:
+            return (element.text or "").strip()
+    return ""
+
+# Function to check whether Flathub marks an appstream component as verified
+def appstream_verified(component):
+    # Flathub publishes this under <custom>, older appstream files used <metadata>
+    for value in component.findall("custom/value") + component.findall("metadata/value"):
+        if value.get("key") == "flathub::verification::verified":
+            return (value.text or "").strip() == "true"
+    return False
+
+# OSI or FSF approved SPDX license IDs, without their -only, -or-later and + suffixes
+# Anything else, including every LicenseRef-* and the NonCommercial and NoDerivatives Creative Commons licenses, is not FOSS
+FLOSS_LICENSES = frozenset(license.lower() for license in (
+    "0BSD", "AFL-3.0", "AGPL-3.0", "Apache-1.1", "Apache-2.0", "APSL-2.0", "Artistic-2.0", "BlueOak-1.0.0",
+    "BSD-1-Clause", "BSD-2-Clause", "BSD-2-Clause-Patent", "BSD-3-Clause", "BSD-3-Clause-Clear", "BSD-4-Clause", "BSL-1.0",
+    "CC-BY-3.0", "CC-BY-4.0", "CC-BY-SA-3.0", "CC-BY-SA-4.0", "CC0-1.0", "CDDL-1.0", "CECILL-2.0", "CECILL-2.1", "CECILL-B", "CECILL-C",
+    "ECL-2.0", "EFL-2.0", "EPL-1.0", "EPL-2.0", "EUPL-1.1", "EUPL-1.2", "FTL", "GFDL-1.1", "GFDL-1.2", "GFDL-1.3",
+    "GPL-1.0", "GPL-2.0", "GPL-3.0", "HPND", "IJG", "ISC", "LGPL-2.0", "LGPL-2.1", "LGPL-3.0", "LPPL-1.3c",
+    "MIT", "MIT-0", "MPL-1.1", "MPL-2.0", "MS-PL", "MS-RL", "NCSA", "ODbL-1.0", "OFL-1.1", "OpenSSL", "OSL-3.0",
+    "PHP-3.01", "PostgreSQL", "Python-2.0", "Ruby", "Unicode-DFS-2016", "Unlicense", "UPL-1.0", "Vim", "W3C", "WTFPL",
+    "X11", "Xnet", "Zlib", "ZPL-2.1",
+))
+
+# Function to check whether an SPDX license expression is a free and open source license, like Flathub's floss subset
+# An OR needs one free choice and an AND needs every part to be free, and anything that can't be parsed isn't free
+def floss_license(license):
+    tokens = re.findall(r"[()]|[^\s()]+", license or "")
+    if not tokens:
+        return False
+
+    def parse_or(position):
+        floss, position = parse_and(position)
+        while position < len(tokens) and tokens[position].upper() == "OR":
+            right, position = parse_and(position + 1)
+            floss = floss or right
+        return floss, position
+
+    def parse_and(position):
+        floss, position = parse_term(position)
+        while position < len(tokens) and tokens[position].upper() == "AND":
+            right, position = parse_term(position + 1)
+            floss = floss and right
+        return floss, position
+
+    def parse_term(position):
+        if position >= len(tokens):
+            raise ValueError(license)
+        if tokens[position] == "(":
+            floss, position = parse_or(position + 1)
+            if position >= len(tokens) or tokens[position] != ")":
+                raise ValueError(license)
+            position += 1
+        elif tokens[position] == ")" or tokens[position].upper() in ("AND", "OR", "WITH"):
+            raise ValueError(license)
+        else:
+            license_id = re.sub(r"(-only|-or-later|\+)$", "", tokens[position].lower())
+            floss, position = license_id in FLOSS_LICENSES, position + 1
+        # License exceptions only grant extra permissions, so they don't change the result
+        if position + 1 < len(tokens) and tokens[position].upper() == "WITH":
+            position += 2
+        return floss, position
+
+    try:
+        floss, position = parse_or(0)
+    except ValueError:
+        return False
+    return floss and position == len(tokens)
+
+# Function to get the label of an app from its metadata, and from the subset remotes it appears in if any were added
+def get_label(license, verified, remotes=()):
+    floss = floss_license(license) or "flathub-floss" in remotes or "flathub-verified_floss" in remotes
+    verified = verified or "flathub-verified" in remotes or "flathub-verified_floss" in remotes
+    if verified and floss:
+        return "Verified & FOSS"
+    elif verified:
+        return "Verified"
+    elif floss:
+        return "FOSS"
+    else:
+        return ""
+
+# Function to turn an appstream component into a dictionary, or None if it isn't an app
+def appstream_app(element):
+    if element.get("type", "desktop-application") not in ("desktop-application", "desktop", "console-application"):
+        return None
+    application_id = appstream_text(element, "id")
+    # Some appstream files still use the legacy ".desktop" suffix on IDs
+    if application_id.endswith(".desktop"):
+        application_id = application_id[:-len(".desktop")]
+    if not application_id:
+        return None
+    return {
+        "application_id": application_id,
+        "name": appstream_text(element, "name") or application_id,
+        "summary": appstream_text(element, "summary"),
+        "keywords": [k.text.strip() for k in element.findall("keywords/keyword") if k.text and k.get(XML_LANG) is None],
+        "categories": [c.text.strip() for c in element.findall("categories/category") if c.text],
+        "license": appstream_text(element, "project_license"),
+        "verified": appstream_verified(element),
+        "ref": appstream_text(element, "bundle") or f"app/{application_id}",
+    }
+
+# Function to split an appstream file into the bytes of its components, with a hash of their content
+# Components don't nest, so they are found without parsing the file, and only new or changed ones need parsing
+def read_appstream_components(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        data = f.read()
+    components = []
+    start = data.find(b"<component")
+    while start >= 0:
+        # Skip the <components> element around them
+        if data[start + len(b"<component"):start + len(b"<component") + 1] not in (b" ", b">", b"\t", b"\n", b"\r"):
+            start = data.find(b"<component", start + 1)
+            continue
+        end = data.find(b"</component>", start)
+        if end < 0:
+            break
+        end += len(b"</component>")
+        component = data[start:end]
+        components.append((hashlib.blake2b(component, digest_size=16).hexdigest(), component))
+        start = data.find(b"<component", end)
+    return components
+
+# Function to get the words of an app for the search index, as the words of all its text, of its name and of its ID
+def app_tokens(app):
+    text = " ".join([app["application_id"], app["name"], app["summary"]] + app["keywords"] + app["categories"])
+    return set(tokenize(text)), tokenize(app["name"]), set(tokenize(app["application_id"]))
+
+# Number of releases shown in the details of an app
+RELEASES_SHOWN = 5
+
+# Function to read the appstream component of one app, without parsing the whole file
+def read_appstream_component(path, application_id):
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            return find_appstream_component(f.read(), application_id)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return find_appstream_component(data, application_id)
+
+# Function to find the appstream component of an app in the bytes of an appstream file
+def find_appstream_component(data, application_id):
+    for needle in (f"<id>{application_id}</id>", f"<id>{application_id}.desktop</id>"):
+        i = data.find(needle.encode())
+        while i >= 0:
+            # The id may also be mentioned by other components, so check it's the one of the enclosing component
+            start = data.rfind(b"<component", 0, i)
+            end = data.find(b"</component>", i)
+            if start >= 0 and end >= 0:
+                try:
+                    component = ET.fromstring(data[start:end + len(b"</component>")])
+                except ET.ParseError:
+                    component = None
+                if component is not None and appstream_text(component, "id") in (application_id, f"{application_id}.desktop"):
+                    return component
+            i = data.find(needle.encode(), i + 1)
+    return None
+
+# Function to turn an appstream description into HTML, keeping only its paragraphs and lists
+def appstream_markup(description):
+    if description is None:
+        return ""
+    parts = []
+    for child in description:
+        if child.get(XML_LANG) is not None:
+            continue
+        if child.tag == "p":
+            parts.append(f"<p>{html.escape(''.join(child.itertext()).strip())}</p>")
+        elif child.tag in ("ul", "ol"):
+            items = "".join(f"<li>{html.escape(''.join(item.itertext()).strip())}</li>" for item in child if item.get(XML_LANG) is None)
+            parts.append(f"<{child.tag}>{items}</{child.tag}>")
+    return "".join(parts)
+
+# Function to get the details of an app shown in the details pane from its appstream component
+def appstream_details(component):
+    releases = []
+    for release in component.findall("releases/release")[:RELEASES_SHOWN]:
+        date = release.get("date", "")
+        if release.get("timestamp", "").isdigit():
+            date = time.strftime("%Y-%m-%d", time.gmtime(int(release.get("timestamp"))))
+        descriptions = [d for d in release.findall("description") if d.get(XML_LANG) is None]
+        releases.append({"version": release.get("version", ""), "date": date, "description": appstream_markup(descriptions[0] if descriptions else None)})
+
+    descriptions = [d for d in component.findall("description") if d.get(XML_LANG) is None]
+    homepage = next((url.text.strip() for url in component.findall("url") if url.get("type") == "homepage" and url.text), "")
+    return {
+        "description": appstream_markup(descriptions[0] if descriptions else None),
+        "developer": appstream_text(component, "developer_name") or appstream_text(component, "developer/name"),
+        "homepage": homepage,
+        "version": releases[0]["version"] if releases else "",
+        "releases": releases,
+    }
+
+# Function to fingerprint appstream files by their commit, mtime and size, returning the fingerprints and a checksum of them all
+def appstream_fingerprint(files):
+    mtimes = {}
+    for remote, path in files:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        # The "active" directory links to the appstream commit, so its target is the appstream checksum
+        mtimes[path] = [os.path.realpath(os.path.dirname(path)), st.st_mtime, st.st_size]
+    return mtimes, hashlib.sha256(json.dumps(sorted(mtimes.items())).encode()).hexdigest()
+
+# Header of catalog snapshots, followed by the version of their layout and their data as JSON
+# Snapshots are copied between qubes, so they are only ever parsed as plain data and checked before they are used
+CATALOG_SNAPSHOT_MAGIC = b"QPAKSCAT"
+CATALOG_SNAPSHOT_FORMAT = 4
+CATALOG_SNAPSHOT_HEADER = struct.Struct("<8sH")
+
+# The parts of the catalog a snapshot holds, and the ones it stores rather than rebuilds
+CATALOG_SNAPSHOT_FIELDS = ("mtimes", "checksum", "components", "sources", "apps", "labels", "index", "field_indexes", "vocabulary", "name_order", "trigram_index")
+CATALOG_SNAPSHOT_STORED_FIELDS = ("mtimes", "checksum", "components", "apps", "index", "field_indexes", "name_order", "trigram_index")
+
+# The text fields every app of a snapshot must have, besides its lists of keywords, categories and remotes
+# Apps of the catalog also have the label and the lowercase name they are indexed with
+CATALOG_SNAPSHOT_APP_FIELDS = operator.itemgetter("application_id", "name", "summary", "license", "ref", "path", "digest")
+CATALOG_SNAPSHOT_INDEXED_APP_FIELDS = operator.itemgetter("application_id", "name", "summary", "license", "ref", "path", "digest", "label", "name_lower")
+CATALOG_SNAPSHOT_APP_LISTS = operator.itemgetter("keywords", "categories", "remotes")
+
+# Function to get the catalog snapshots to start from, the user's one first and then one baked into the template
+def catalog_snapshot_paths():
+    return [os.environ.get("QPAKS_CATALOG_SNAPSHOT") or os.path.join(cache_dir(), "catalog.snapshot"), "/usr/share/q-paks/catalog.snapshot"]
+
+# Function to check that an object of a snapshot has the expected type, raising ValueError if not
+def snapshot_value(value, expected):
+    if not isinstance(value, expected):
+        raise ValueError("invalid catalog data")
+    return value
+
+# Function to check that an app of a snapshot has every field an app parsed from appstream has, raising ValueError if not
+# Snapshots hold tens of thousands of apps, so the types of their fields are collected rather than checked one by one
+def snapshot_app(app, fields=CATALOG_SNAPSHOT_APP_FIELDS):
+    try:
+        lists = CATALOG_SNAPSHOT_APP_LISTS(snapshot_value(app, dict))
+        if type(app["verified"]) is not bool or not set(map(type, fields(app))) <= {str}:
+            raise ValueError("invalid catalog data")
+    except KeyError:
+        raise ValueError("invalid catalog data")
+    if set(map(type, lists)) != {list} or not set(map(type, itertools.chain.from_iterable(lists))) <= {str}:
+        raise ValueError("invalid catalog data")
+    return app
+
+# Function to read a catalog snapshot, raising ValueError if it was written by another version of Q-Paks or doesn't hold a valid catalog
+# Snapshots store the apps once, and refer to them and to the indexed words by their position everywhere else
+# The app of a component is written as its ID when it is the same app as in the catalog, and the parts of the catalog that only repeat others are rebuilt
+def read_catalog_snapshot(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < CATALOG_SNAPSHOT_HEADER.size:
+        raise ValueError("truncated file")
+    magic, snapshot_format = CATALOG_SNAPSHOT_HEADER.unpack_from(data)
+    if magic != CATALOG_SNAPSHOT_MAGIC:
+        raise ValueError("not a catalog snapshot")
+    if snapshot_format != CATALOG_SNAPSHOT_FORMAT:
+        raise ValueError("written by another version")
+    # Loading creates millions of objects, which would otherwise set off garbage collections all along
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        stored = snapshot_value(json.loads(data[CATALOG_SNAPSHOT_HEADER.size:]), dict)
+        if any(field not in stored for field in CATALOG_SNAPSHOT_STORED_FIELDS):
+            raise ValueError("missing catalog data")
+
+        apps = snapshot_value(stored["apps"], dict)
+        for application_id, app in apps.items():
+            if snapshot_app(app, CATALOG_SNAPSHOT_INDEXED_APP_FIELDS)["application_id"] != application_id:
+                raise ValueError("invalid catalog data")
+        application_ids = list(apps)
+
+        # Apps come from the components of the appstream files, in the order the files are read, like a build finds them
+        components = snapshot_value(stored["components"], dict)
+        sources = {}
+        for path, parsed in components.items():
+            for digest, app in snapshot_value(parsed, dict).items():
+                if isinstance(app, str):
+                    app = parsed[digest] = snapshot_value(apps.get(app), dict)
+                elif app is not None:
+                    snapshot_app(app)
+                if app is not None:
+                    sources[app["application_id"]] = sources.get(app["application_id"], ()) + ((path, digest),)
+        if sources.keys() != apps.keys():
+            raise ValueError("invalid catalog data")
+
+        index = {token: set(map(application_ids.__getitem__, snapshot_value(positions, list))) for token, positions in snapshot_value(stored["index"], dict).items()}
+        field_indexes = snapshot_value(stored["field_indexes"], dict)
+        if field_indexes.keys() != {"start", "name", "id"}:
+            raise ValueError("invalid catalog data")
+        for field, postings in field_indexes.items():
+            field_indexes[field] = {token: set(map(application_ids.__getitem__, snapshot_value(positions, list))) for token, positions in snapshot_value(postings, dict).items()}
+        vocabulary = sorted(index)
+        trigram_index = {trigram: list(map(vocabulary.__getitem__, snapshot_value(positions, list))) for trigram, positions in snapshot_value(stored["trigram_index"], dict).items()}
+        name_order = {application_ids[position]: i for i, position in enumerate(snapshot_value(stored["name_order"], list))}
+        if len(name_order) != len(apps):
+            raise ValueError("invalid catalog data")
+    except (TypeError, IndexError, RecursionError):
+        raise ValueError("invalid catalog data")
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return {
+        "mtimes": snapshot_value(stored["mtimes"], dict),
+        "checksum": snapshot_value(stored["checksum"], str),
+        "components": components,
+        "sources": sources,
+        "apps": apps,
+        "labels": {application_id: app["label"] for application_id, app in apps.items()},
+        "index": index,
+        "field_indexes": field_indexes,
+        "vocabulary": vocabulary,
+        "name_order": name_order,
+        "trigram_index": trigram_index,
+    }
+
+# In-memory catalog of the apps in the local appstream metadata, with an inverted index for searching
+class Catalog:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        self.mtimes = None
+        self.version = 0
+        self.checksum = None  # Identifies the appstream data the catalog was built from, across sessions
+        self.components = {}  # Appstream file to the apps parsed from its components by content hash, None for other components
+        self.sources = {}  # App ID to the (appstream file, content hash) pairs of the components it was merged from
+        self.apps = {}
+        self.field_indexes = {"start": {}, "name": {}, "id": {}}
+        self.labels = {}
+        self.index = {}
+        self.vocabulary = []
+        self.name_order = {}
+        self.trigram_index = {}
+        self.stale = False  # Whether the data comes from a snapshot of other appstream data than the local one
+
+    # Rebuild the index if the appstream files changed since they were last parsed
+    # Only one build runs at a time, and searches keep using the current data until it is swapped in
+    # Unless blocking, a build that is already running isn't waited for when there is data to search meanwhile
+    # An empty catalog starts from a snapshot if there is one, which is searched until it is rebuilt in the background
+    def refresh(self, blocking=True):
+        if not self.build_lock.acquire(blocking or not self.apps):
+            return
+        try:
+            files = find_appstream_files()
+            mtimes, checksum = appstream_fingerprint(files)
+            if not self.apps:
+                self.load_snapshot(mtimes, checksum)
+            if mtimes == self.mtimes or (self.stale and not mtimes):
+                return
+            if self.stale and not blocking:
+                threading.Thread(target=self.refresh, daemon=True).start()
+                return
+            self.build(files, mtimes, checksum)
+        finally:
+            self.build_lock.release()
+
+    # Swap in the first catalog snapshot that can be read, which is only stale if it wasn't built from the local appstream data
+    def load_snapshot(self, mtimes, checksum):
+        for path in catalog_snapshot_paths():
+            try:
+                with profiler.span("load catalog snapshot", path=path):
+                    snapshot = read_catalog_snapshot(path)
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError) as e:
+                print(f"Ignoring the catalog snapshot '{path}': {e}")
+                continue
+
+            with self.lock:
+                for field in CATALOG_SNAPSHOT_FIELDS:
+                    setattr(self, field, snapshot[field])
+                self.stale = snapshot["checksum"] != checksum
+                if not self.stale:
+                    self.mtimes = mtimes
+                self.version += 1
+            gc.collect()
+            gc.freeze()
+            print(f"Loaded {len(self.apps)} apps from the catalog snapshot '{path}'")
+            return True
+        return False
+
+    # Write the catalog to a snapshot, replacing it atomically
+    def save_snapshot(self, path):
+        with self.lock:
+            positions = {application_id: i for i, application_id in enumerate(self.apps)}
+            token_positions = {token: i for i, token in enumerate(self.vocabulary)}
+            snapshot = {
+                "mtimes": self.mtimes,
+                "checksum": self.checksum,
+                "components": {path: {digest: app["application_id"] if app is not None and self.apps.get(app["application_id"]) is app else app for digest, app in parsed.items()}
+                               for path, parsed in self.components.items()},
+                "apps": self.apps,
+                "index": {token: [positions[application_id] for application_id in application_ids] for token, application_ids in self.index.items()},
+                "field_indexes": {field: {token: [positions[application_id] for application_id in application_ids] for token, application_ids in postings.items()}
+                                  for field, postings in self.field_indexes.items()},
+                "name_order": [positions[application_id] for application_id in sorted(self.name_order, key=self.name_order.get)],
+                "trigram_index": {trigram: [token_positions[token] for token in tokens] for trigram, tokens in self.trigram_index.items()},
+            }
+            data = json.dumps(snapshot, separators=(",", ":")).encode()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            f.write(CATALOG_SNAPSHOT_HEADER.pack(CATALOG_SNAPSHOT_MAGIC, CATALOG_SNAPSHOT_FORMAT))
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    # Parse the components of the appstream files that changed, and apply the apps they add, change and remove to the index
+    # Small changes are applied to the index in place, and big ones build a new index that is then swapped in
+    def build(self, files, mtimes, checksum):
+        components = {}
+        apps = {}
+        sources = {}
+        for remote, path in files:
+            parsed = self.components.get(path, {})
+            if self.mtimes is None or self.mtimes.get(path) != mtimes.get(path):
+                try:
+                    with profiler.span("read appstream components", path=path):
+                        chunks = read_appstream_components(path)
+                except (OSError, EOFError) as e:
+                    print(f"Failed to read appstream file '{path}': {e}")
+                    continue
+
+                known, parsed = parsed, {}
+                with profiler.span("parse appstream", path=path):
+                    for digest, chunk in chunks:
+                        if digest in parsed:
+                            continue
+                        if digest in known:
+                            parsed[digest] = known[digest]
+                            continue
+                        try:
+                            app = appstream_app(ET.fromstring(chunk))
+                        except ET.ParseError as e:
+                            print(f"Skipping a component of appstream file '{path}': {e}")
+                            app = None
+                        if app is not None:
+                            app.update(remotes=[remote], path=path, digest=digest)
+                        parsed[digest] = app
+            components[path] = parsed
+
+            for digest, app in parsed.items():
+                if app is None:
+                    continue
+                application_id = app["application_id"]
+                existing = apps.get(application_id)
+                if existing:
+                    # Parsed apps are kept for the next build, so merging makes a copy
+                    apps[application_id] = dict(existing,
+                                                remotes=existing["remotes"] + [remote] if remote not in existing["remotes"] else existing["remotes"],
+                                                license=existing["license"] or app["license"],
+                                                verified=existing["verified"] or app["verified"])
+                    sources[application_id] += ((path, digest),)
+                else:
+                    apps[application_id] = app
+                    sources[application_id] = ((path, digest),)
+
+        # Apps merged from the same components are unchanged, and keep their place in the index
+        removed = [self.apps[application_id] for application_id, source in self.sources.items() if sources.get(application_id) != source]
+        added = []
+        for application_id, source in sources.items():
+            if self.sources.get(application_id) == source:
+                apps[application_id] = self.apps[application_id]
+                continue
+            # Classify every app once, so searches only look the label up
+            app = apps[application_id]
+            app["label"] = get_label(app["license"], app["verified"], app["remotes"])
+            app["name_lower"] = app["name"].lower()
+            added.append(app)
+
+        old_checksum = self.checksum
+        with profiler.span("update index", added=len(added), removed=len(removed)):
+            rebuild = len(added) + len(removed) > len(self.apps) // 4
+            if rebuild:
+                rebuilt = Catalog()
+                rebuilt.update(list(apps.values()), [])
+                with self.lock:
+                    for field in ("apps", "labels", "index", "field_indexes", "vocabulary", "name_order", "trigram_index"):
+                        setattr(self, field, getattr(rebuilt, field))
+            else:
+                self.update(added, removed)
+
+        with self.lock:
+            self.components = components
+            self.sources = sources
+            self.mtimes = mtimes
+            self.checksum = checksum
+            self.stale = False
+            self.version += 1
+
+        # Cached results a small change can't affect are kept, the others are dropped once results of the new catalog are cached
+        if (added or removed) and not rebuild:
+            changes = Catalog()
+            changes.update(added, [])
+            search_cache.update(old_checksum, checksum, {app["application_id"] for app in removed}, changes.search)
+
+        # The catalog is millions of objects that live until the next build, so spare them from every full garbage collection
+        gc.collect()
+        gc.freeze()
+        changed = len({app["application_id"] for app in added} & {app["application_id"] for app in removed})
+        print(f"Indexed {len(apps)} apps from {len(files)} appstream files, with {len(added) - changed} added, {changed} changed and {len(removed) - changed} removed")
+
+    # Add and remove apps from the index, and the words only they contain
+    # Every word is indexed with the apps containing it, and the words of the name and the ID are also indexed separately, so they can be ranked higher
+    # The trigrams of the words find substring and fuzzy matches without scanning them all
+    def update(self, added, removed):
+        with self.lock:
+            dropped = set()
+            for app in removed:
+                application_id = app["application_id"]
+                del self.apps[application_id]
+                del self.labels[application_id]
+                text_tokens, name_tokens, id_tokens = app_tokens(app)
+                for postings, tokens in ((self.index, text_tokens), (self.field_indexes["start"], name_tokens[:1]), (self.field_indexes["name"], name_tokens), (self.field_indexes["id"], id_tokens)):
+                    for token in tokens:
+                        application_ids = postings.get(token)
+                        if application_ids is None:
+                            continue
+                        application_ids.discard(application_id)
+                        if not application_ids:
+                            del postings[token]
+                            if postings is self.index:
+                                dropped.add(token)
+
+            new = set()
+            for app in added:
+                application_id = app["application_id"]
+                self.apps[application_id] = app
+                self.labels[application_id] = app["label"]
+                text_tokens, name_tokens, id_tokens = app_tokens(app)
+                for postings, tokens in ((self.index, text_tokens), (self.field_indexes["start"], name_tokens[:1]), (self.field_indexes["name"], name_tokens), (self.field_indexes["id"], id_tokens)):
+                    for token in tokens:
+                        application_ids = postings.get(token)
+                        if application_ids is None:
+                            application_ids = postings[token] = set()
+                            if postings is self.index:
+                                if token in dropped:
+                                    dropped.discard(token)
+                                else:
+                                    new.add(token)
+                        application_ids.add(application_id)
+
+            # A snapshot can come from anywhere, so words missing from the trigram index are skipped rather than trusted to be there
+            for token in dropped:
+                for trigram in trigrams(token):
+                    tokens = self.trigram_index.get(trigram)
+                    if tokens is None or token not in tokens:
+                        continue
+                    tokens.remove(token)
+                    if not tokens:
+                        del self.trigram_index[trigram]
+            for token in new:
+                for trigram in trigrams(token):
+                    self.trigram_index.setdefault(trigram, []).append(token)
+
+            # A few words are inserted in place, but sorting them all again is quicker for many
+            if len(new) + len(dropped) > len(self.vocabulary) // 8:
+                self.vocabulary = sorted(self.index)
+            else:
+                for token in dropped:
+                    del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+                for token in new:
+                    bisect.insort(self.vocabulary, token)
+
+            # Apps keep their place in the order of names unless one is new or was renamed
+            old_names = {app["application_id"]: app["name_lower"] for app in removed}
+            if any(old_names.get(app["application_id"]) != app["name_lower"] for app in added):
+                self.name_order = {application_id: i for i, application_id in enumerate(sorted(self.apps, key=lambda application_id: self.apps[application_id]["name_lower"]))}
+            else:
+                for application_id in old_names.keys() - self.apps.keys():
+                    del self.name_order[application_id]
+
+    # Return the indexed words matching a query word, with their similarity to it
+    # Words containing the query word match fully, like the substring match of `flatpak search`, and words a typo or two away match partly
+    def match_term(self, term):
+        # One or two letters are in too many words to be useful anywhere but at the start of one
+        if len(term) < 3:
+            matches = {}
+            for i in range(bisect.bisect_left(self.vocabulary, term), len(self.vocabulary)):
+                if not self.vocabulary[i].startswith(term):
+                    break
+                matches[self.vocabulary[i]] = 1.0
+            return matches
+
+        # Words containing the query word contain all of its inner trigrams
+        candidates = None
+        for trigram in sorted((term[i:i + 3] for i in range(len(term) - 2)), key=lambda trigram: len(self.trigram_index.get(trigram, ()))):
+            tokens = self.trigram_index.get(trigram, ())
+            candidates = set(tokens) if candidates is None else candidates.intersection(tokens)
+            if not candidates:
+                break
+        matches = {token: 1.0 for token in candidates if term in token}
+
+        # Every edit changes at most three trigrams, so words sharing fewer cannot be close enough
+        limit = 1 if len(term) <= 5 else 2
+        term_trigrams = trigrams(term)
+        shared = collections.Counter()
+        for trigram in term_trigrams:
+            shared.update(self.trigram_index.get(trigram, ()))
+        for token, count in shared.items():
+            if token in matches or count < len(term_trigrams) - 3 * limit or abs(len(token) - len(term)) > limit:
+                continue
+            distance = edit_distance(term, token, limit)
+            if distance <= limit:
+                matches[token] = 1.0 - distance / max(len(term), len(token))
+        return matches
+
+    # Return the best score of every app matching a query word, given the words matching it
+    def term_scores(self, term, matches):
+        scores = {}
+        for field, (word_score, prefix_score, substring_score) in MATCH_SCORES.items():
+            postings = self.index if field == "text" else self.field_indexes[field]
+            for token, similarity in matches.items():
+                application_ids = postings.get(token)
+                if not application_ids:
+                    continue
+                if similarity < 1:
+                    score = word_score * similarity
+                elif token == term:
+                    score = word_score
+                elif token.startswith(term):
+                    score = prefix_score
+                else:
+                    score = substring_score
+                if not score:
+                    continue
+                for application_id in application_ids:
+                    if score > scores.get(application_id, 0):
+                        scores[application_id] = score
+        return scores
+
+    # Return the apps matching every word of the query, best matches first
+    def search(self, query):
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self.lock:
+            # An app has to match every word of the query, and its score adds up the scores of each of them
+            totals = None
+            for term in terms:
+                scores = self.term_scores(term, self.match_term(term))
+                if totals is None:
+                    totals = scores
+                else:
+                    totals = {application_id: total + scores[application_id] for application_id, total in totals.items() if application_id in scores}
+                if not totals:
+                    return []
+
+            if len(terms) > 1:
+                phrase = " ".join(terms)
+                for application_id in totals:
+                    if self.apps[application_id]["name_lower"].startswith(phrase):
+                        totals[application_id] += QUERY_PREFIX_BONUS
+
+            # Apps with the same score are sorted by name
+            ranked = sorted(totals, key=lambda application_id: (-totals[application_id], self.name_order[application_id]))
+            return [self.apps[application_id] for application_id in ranked]
+
+catalog = Catalog()
+
+# Age after which the local appstream metadata is refreshed in the background, in seconds
+try:
+    APPSTREAM_TTL = int(os.environ.get("QPAKS_APPSTREAM_TTL", 6 * 60 * 60))
+except ValueError:
+    print("QPAKS_APPSTREAM_TTL must be a number of seconds, using the default")
+    APPSTREAM_TTL = 6 * 60 * 60
+
+appstream_lock = threading.Lock()
+
+# Function to get when the user's appstream metadata was last updated, as the time of the oldest remote's copy
+# flatpak touches a .timestamp file next to the active copy whenever it updates or checks it, None means there is no copy
+def appstream_timestamp():
+    timestamps = []
+    pattern = os.path.join(user_installation_path(), "appstream", "*", "*", "active")
+    for active_dir in glob.glob(pattern):
+        for path in (os.path.join(os.path.dirname(active_dir), ".timestamp"), active_dir):
+            try:
+                timestamps.append(os.lstat(path).st_mtime)
+                break
+            except OSError:
+                pass
+    return min(timestamps) if timestamps else None
+
+# Function to download fresh appstream metadata if the local copy is older than max_age, and swap it into the catalog
+# Concurrent callers wait for the download already running instead of starting another
+def refresh_appstream(max_age):
+    with appstream_lock:
+        timestamp = appstream_timestamp()
+        if timestamp is None or time.time() - timestamp > max_age:
+            try:
+                with profiler.span("update appstream"):
+                    get_backend().update_appstream()
+            except FlatpakError as e:
+                print(f"Failed to update appstream metadata: {e}")
+    catalog.refresh()
+
+# Function to describe how long ago something happened
+def format_age(seconds):
+    for unit, length in (("day", 24 * 60 * 60), ("hour", 60 * 60), ("minute", 60)):
+        if seconds >= length:
+            count = int(seconds // length)
+            return f"{count} {unit}{'s' if count > 1 else ''} ago"
+    return "just now"
+
+# Function to get the directory Q-Paks keeps its caches in
+def cache_dir():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "q-paks")
+
+# Function to normalize a query, so queries that match the same apps share a cache entry
+def normalize_query(query):
+    return " ".join(tokenize(query))
+
+# Version of the cached results, which is bumped whenever the same catalog would give different results
+SEARCH_CACHE_FORMAT = 3
+
+# Limits of the search cache, which drops the least recently used queries beyond them
+SEARCH_CACHE_MAX_ENTRIES = 500
+SEARCH_CACHE_MAX_BYTES = 4 * 1024 * 1024
+
+# Persistent cache of search results by normalized query, only valid for the catalog checksum it was filled from
+class SearchCache:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.dirty = False
+        self.checksum = None
+        self.entries = collections.OrderedDict()  # Query to results JSON, least recently used first
+        self.size = 0
+
+    # Read the cache file the first time the cache is used, and save the cache on exit
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        atexit.register(self.save)
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get("format") != SEARCH_CACHE_FORMAT:
+                return
+            self.checksum = data["checksum"]
+            for query, results_json in data["entries"]:
+                self.entries[query] = results_json
+                self.size += len(results_json)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Ignoring the search cache '{self.path}': {e}")
+            self.entries.clear()
+            self.size = 0
+
+    # Drop every entry if the catalog changed since they were cached
+    def validate(self, checksum):
+        if checksum != self.checksum:
+            self.checksum = checksum
+            self.entries.clear()
+            self.size = 0
+            self.dirty = True
+
+    # Return the cached results JSON of a query, or None
+    # The entries of another catalog are kept, as the catalog may be about to update them to its new checksum
+    def get(self, query, checksum):
+        with self.lock:
+            self.load()
+            if checksum != self.checksum:
+                return None
+            results_json = self.entries.get(query)
+            if results_json is not None:
+                self.entries.move_to_end(query)
+                self.dirty = True
+            return results_json
+
+    # Cache the results JSON of a query, evicting the least recently used entries beyond the limits
+    def put(self, query, checksum, results_json):
+        with self.lock:
+            self.load()
+            self.validate(checksum)
+            if query in self.entries:
+                self.size -= len(self.entries.pop(query))
+            self.entries[query] = results_json
+            self.size += len(results_json)
+            while len(self.entries) > SEARCH_CACHE_MAX_ENTRIES or self.size > SEARCH_CACHE_MAX_BYTES:
+                self.size -= len(self.entries.popitem(last=False)[1])
+            self.dirty = True
+
+    # Move the entries over to a catalog that changed, dropping the ones whose results had a removed app or would match an added one
+    # Apps that are changed are both removed and added, and the results of other apps stay the same
+    def update(self, old_checksum, checksum, removed, matches):
+        with self.lock:
+            self.load()
+            if old_checksum is None or old_checksum != self.checksum:
+                return
+            for query, results_json in list(self.entries.items()):
+                if matches(query) or any(result["application_id"] in removed for result in json.loads(results_json)):
+                    self.size -= len(self.entries.pop(query))
+            self.checksum = checksum
+            self.dirty = True
+
+    # Write the cache file if anything changed, replacing it atomically
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path + ".tmp", "w") as f:
+                    json.dump({"format": SEARCH_CACHE_FORMAT, "checksum": self.checksum, "entries": list(self.entries.items())}, f)
+                os.replace(self.path + ".tmp", self.path)
+                self.dirty = False
+            except OSError as e:
+                print(f"Failed to save the search cache '{self.path}': {e}")
+
+search_cache = SearchCache(os.path.join(cache_dir(), "search-cache.json"))
+
+# Cache of the details of apps by remote and ref, kept on disk once they are complete
+# Entries are only valid for the content hash of the appstream component they were read from, which changes with the app
+class DetailsCache:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}  # Key to (checksum, details)
+
+    # Get the file an entry is kept in
+    def entry_path(self, key):
+        return os.path.join(self.path, re.sub(r"[^A-Za-z0-9._-]", "_", key) + ".json")
+
+    # Return the cached details, or None
+    def get(self, key, checksum):
+        with self.lock:
+            if key not in self.entries:
+                try:
+                    with open(self.entry_path(key)) as f:
+                        data = json.load(f)
+                    self.entries[key] = (data["checksum"], data["details"])
+                except FileNotFoundError:
+                    return None
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    print(f"Ignoring the cached details of '{key}': {e}")
+                    return None
+
+            entry_checksum, details = self.entries[key]
+            return details if entry_checksum == checksum else None
+
+    # Cache details, in memory only unless they are complete
+    def put(self, key, checksum, details, persist):
+        with self.lock:
+            self.entries[key] = (checksum, details)
+            if not persist:
+                return
+            try:
+                os.makedirs(self.path, exist_ok=True)
+                with open(self.entry_path(key) + ".tmp", "w") as f:
+                    json.dump({"checksum": checksum, "details": details}, f)
+                os.replace(self.entry_path(key) + ".tmp", self.entry_path(key))
+            except OSError as e:
+                print(f"Failed to cache the details of '{key}': {e}")
+
+details_cache = DetailsCache(os.path.join(cache_dir(), "details"))
+
+# Regular expressions for the progress flatpak prints, e.g. "Installing 2/3… ████▍ 45%"
+PROGRESS_STEP_RE = re.compile(r"(\d+)/(\d+)")
+PROGRESS_PERCENT_RE = re.compile(r"(\d+)%")
+
+# Function to turn a line of flatpak output into an overall percentage, or None if it has no progress
+def parse_progress(line):
+    percent = PROGRESS_PERCENT_RE.findall(line)
+    if not percent:
+        return None
+    percent = min(int(percent[-1]), 100)
+
+    # Spread the progress of each step of a transaction over the whole bar
+    step = PROGRESS_STEP_RE.search(line)
+    if step and 0 < int(step.group(1)) <= int(step.group(2)):
+        current, total = int(step.group(1)), int(step.group(2))
+        return ((current - 1) * 100 + percent) // total
+    return percent
+
+# A flatpak transaction waiting in, or run by, the job queue
+class FlatpakJob:
+    def __init__(self, description, action, refs, installation="user", remote="flathub", removals=(), commits=None, remotes=None):
+        self.description = description
+        self.action = action  # One of install, uninstall, update, sync or cleanup
+        self.refs = refs  # Application IDs, an update with none updates everything, a sync installs them and a cleanup deletes their data
+        self.installation = installation
+        self.remote = remote
+        self.removals = list(removals)  # Application IDs a sync uninstalls
+        self.commits = commits or {}  # Commits a sync pins apps to, by application ID
+        self.remotes = remotes or {}  # Remotes to install apps from instead of remote, by application ID
+        self.state = "queued"  # One of queued, running, done, failed or cancelled
+        self.progress = 0
+        self.status = "Queued"
+        self.abort = None  # Set by the backend while the transaction runs
+        self.cancelled = False
+
+# Function to get the display name of a deployed app from its metainfo or desktop file
+def deployed_app_name(app_id, deploy_dir):
+    for metainfo in (
+        os.path.join(deploy_dir, "files", "share", "metainfo", f"{app_id}.metainfo.xml"),
+        os.path.join(deploy_dir, "files", "share", "metainfo", f"{app_id}.appdata.xml"),
+        os.path.join(deploy_dir, "files", "share", "appdata", f"{app_id}.appdata.xml"),
+    ):
+        try:
+            name = appstream_text(ET.parse(metainfo).getroot(), "name")
+        except (OSError, ET.ParseError):
+            continue
+        if name:
+            return name
+
+    try:
+        with open(os.path.join(deploy_dir, "export", "share", "applications", f"{app_id}.desktop")) as f:
+            for line in f:
+                if line.startswith("Name="):
+                    return line[len("Name="):].strip()
+    except OSError:
+        pass
+
+    return app_id
+
+# Names of deployed apps by deploy directory, which never change since each commit gets its own directory
+deployed_app_names = {}
+
+# Function to read the apps deployed in a Flatpak installation directory, or None if its layout is not recognized
+def read_installation_apps(installation):
+    apps = {}
+    app_dir = os.path.join(installation, "app")
+    if not os.path.isdir(app_dir):
+        return apps
+
+    for app_id in os.listdir(app_dir):
+        # "current" points at the default arch/branch, whose "active" points at the deployed commit
+        deploy_dir = os.path.realpath(os.path.join(app_dir, app_id, "current", "active"))
+        if not os.path.isfile(os.path.join(deploy_dir, "metadata")):
+            return None
+        if deploy_dir not in deployed_app_names:
+            deployed_app_names[deploy_dir] = deployed_app_name(app_id, deploy_dir)
+        apps[app_id] = deployed_app_names[deploy_dir]
+    return apps
+
+# Function to list every installed app as (id, name, installation) tuples, core system packages included
+# The user and system installations are read from disk, and the backend is only asked if their layout isn't recognized
+def list_installed_apps():
+    installed = []
+    for installation_name, installation in (("user", user_installation_path()), ("system", system_installation_path())):
+        installation_apps = read_installation_apps(installation)
+        if installation_apps is None:
+            installed = None
+            break
+        for app_id, name in installation_apps.items():
+            installed.append((app_id, name, installation_name))
+
+    if installed is None:
+        try:
+            installed = get_backend().list_installed()
+        except FlatpakError as e:
+            print(f"Error retrieving installed apps: {e}")
+            installed = []
+    return installed
+
+# Function to map installed apps to the installation they are in, given every installed app from list_installed_apps
+# An app installed for the user and system-wide is the user's one, like in the window
+def app_installations(installed_apps):
+    installations = {}
+    for app_id, name, installation in installed_apps:
+        if installation == "user" or app_id not in installations:
+            installations[app_id] = installation
+    return installations
+
+# Function to retrieve the list of installed apps shown in the window and return as a dictionary by name
+def get_installed_apps():
+    apps = {}
+    for app_id, name, installation_name in list_installed_apps():
+        # Apps installed for the user take precedence over system-wide ones with the same name
+        if valid_package(app_id) and not (name in apps and apps[name]["Installation"] == "user"):
+            apps[name] = {
+                "ID": app_id,
+                "Name": name,
+                "Installation": installation_name,
+            }
+
+    return apps
+
+# Multipliers of the size units flatpak prints, which are decimal like GLib's g_format_size
+SIZE_UNITS = {"bytes": 1, "B": 1, "kB": 1000, "KB": 1000, "MB": 1000 ** 2, "GB": 1000 ** 3, "TB": 1000 ** 4}
+
+# Function to turn a size printed by flatpak, like "105.6 MB", into bytes, or None if it can't be read
+def parse_size(text):
+    parts = text.replace("\u00a0", " ").split()
+    try:
+        return int(float(parts[0]) * SIZE_UNITS[parts[1]]) if len(parts) == 2 else int(parts[0])
+    except (ValueError, KeyError, IndexError):
+        return None
+
+# Function to format a number of bytes the way flatpak does
+def format_size(size):
+    for unit in ("TB", "GB", "MB", "kB"):
+        if size >= SIZE_UNITS[unit]:
+            return f"{size / SIZE_UNITS[unit]:.1f} {unit}"
+    return f"{size} bytes"
+
+# Function to list the refs deployed in a Flatpak installation directory, as dictionaries with the directory of their active commit
+def installation_deploys(installation, installation_name):
+    deploys = []
+    for kind in ("app", "runtime"):
+        kind_dir = os.path.join(installation, kind)
+        for ref_id in sorted(os.listdir(kind_dir)) if os.path.isdir(kind_dir) else []:
+            for arch in sorted(os.listdir(os.path.join(kind_dir, ref_id))):
+                # "current" links to the default arch and branch of an app, which is listed already
+                arch_dir = os.path.join(kind_dir, ref_id, arch)
+                if arch == "current" or os.path.islink(arch_dir) or not os.path.isdir(arch_dir):
+                    continue
+                for branch in sorted(os.listdir(arch_dir)):
+                    deploy_dir = os.path.realpath(os.path.join(arch_dir, branch, "active"))
+                    if os.path.isdir(deploy_dir):
+                        deploys.append({"kind": kind, "id": ref_id, "arch": arch, "branch": branch, "installation": installation_name, "deploy_dir": deploy_dir})
+    return deploys
+
+# Function to get the disk usage of everything under a directory by inode, so files hard linked together count once
+# Returns the device of the directory and the bytes of each inode on it
+def directory_inodes(path):
+    inodes = {}
+    try:
+        device = os.lstat(path).st_dev
+    except OSError:
+        return None, inodes
+    directories = [path]
+    while directories:
+        try:
+            with os.scandir(directories.pop()) as entries:
+                for entry in entries:
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                        if entry.is_dir(follow_symlinks=False):
+                            directories.append(entry.path)
+                    except OSError:
+                        continue
+                    inodes[st.st_ino] = st.st_blocks * 512
+        except OSError:
+            continue
+    return device, inodes
+
+# Version of the cached disk usage, which is bumped whenever it is accounted differently
+DISK_USAGE_CACHE_FORMAT = 2
+
+# Function to get what identifies the content of an app data directory, the modification times of it and of the directories in it
+# Nothing writes to the data of an app that was removed, so files only come and go there when it's cleaned up or reinstalled
+def data_directory_signature(path):
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        with os.scandir(path) as entries:
+            directories = [(entry.name, entry.stat(follow_symlinks=False).st_mtime_ns) for entry in entries if entry.is_dir(follow_symlinks=False)]
+    except OSError:
+        return None
+    return (mtime, tuple(sorted(directories)))
+
+# Persistent cache of the disk usage of deployed refs by inode, and of the data removed apps left behind
+# A deploy directory is named after the commit it checks out, which never changes, so its entry is valid for as long as it exists
+class DiskUsageCache:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.dirty = False
+        self.entries = {}  # Deploy directory to its device and the bytes of each of its inodes
+        self.data = {}  # App data directory to its signature and its size
+
+    # Read the cache file the first time the cache is used
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        try:
+            with open(self.path, "rb") as f:
+                data = marshal.load(f)
+            if data.get("format") == DISK_USAGE_CACHE_FORMAT:
+                self.entries = data["entries"]
+                self.data = data["data"]
+        except (OSError, ValueError, EOFError, TypeError, KeyError, AttributeError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Ignoring the disk usage cache '{self.path}': {e}")
+
+    # Return the device and the bytes of each inode of a deploy directory, walking it if it isn't cached yet
+    def get(self, deploy_dir):
+        with self.lock:
+            self.load()
+            if deploy_dir not in self.entries:
+                with profiler.span("walk deploy", path=deploy_dir):
+                    self.entries[deploy_dir] = directory_inodes(deploy_dir)
+                self.dirty = True
+            return self.entries[deploy_dir]
+
+    # Return the bytes an app data directory uses, walking it only if it changed since it was last walked
+    def data_size(self, data_dir):
+        signature = data_directory_signature(data_dir)
+        with self.lock:
+            self.load()
+            entry = self.data.get(data_dir)
+            if entry is not None and signature is not None and entry[0] == signature:
+                return entry[1]
+        with profiler.span("walk app data", path=data_dir):
+            device, inodes = directory_inodes(data_dir)
+        with self.lock:
+            self.data[data_dir] = (signature, sum(inodes.values()))
+            self.dirty = True
+            return self.data[data_dir][1]
+
+    # Forget the deploys and app data that are gone, and write the cache file if anything changed, replacing it atomically
+    def save(self, deploy_dirs, data_dirs=()):
+        with self.lock:
+            for deploy_dir in set(self.entries) - set(deploy_dirs):
+                del self.entries[deploy_dir]
+                self.dirty = True
+            for data_dir in set(self.data) - set(data_dirs):
+                del self.data[data_dir]
+                self.dirty = True
+            if not self.dirty:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path + ".tmp", "wb") as f:
+                    marshal.dump({"format": DISK_USAGE_CACHE_FORMAT, "entries": self.entries, "data": self.data}, f)
+                os.replace(self.path + ".tmp", self.path)
+                self.dirty = False
+            except OSError as e:
+                print(f"Failed to save the disk usage cache '{self.path}': {e}")
+
+disk_usage_cache = DiskUsageCache(os.path.join(cache_dir(), "disk-usage.cache"))
+
+# Function to account the disk usage of the installed apps and runtimes, and of the data removed apps left behind
+# OSTree deduplicates files by hard linking them to the same object, so every inode counts once:
+# the size of a ref is what only it uses, and what it shares with other refs is counted apart
+def disk_usage():
+    refs = []
+    for installation_name, installation in (("user", user_installation_path()), ("system", system_installation_path())):
+        refs += installation_deploys(installation, installation_name)
+
+    with profiler.span("disk usage", refs=len(refs)):
+        usage = [disk_usage_cache.get(ref["deploy_dir"]) for ref in refs]
+        owners = collections.Counter()
+        for device, inodes in usage:
+            owners.update((device, inode) for inode in inodes)
+        for ref, (device, inodes) in zip(refs, usage):
+            ref["size"] = ref["shared"] = 0
+            for inode, size in inodes.items():
+                ref["size" if owners[(device, inode)] == 1 else "shared"] += size
+
+    # Runtimes are used when an app, or a runtime that is used, names them as its runtime or extends one of its extension points
+    runtimes = set()
+    extension_points = set()
+    needed = [ref for ref in refs if ref["kind"] == "app"]
+    for ref in refs:
+        ref["unused"] = ref["kind"] == "runtime"
+    while needed:
+        ref = needed.pop()
+        try:
+            with open(os.path.join(ref["deploy_dir"], "metadata")) as f:
+                runtime, extensions = metadata_dependencies(f.read())
+        except OSError:
+            runtime, extensions = "", []
+        runtimes.add(runtime)
+        extension_points.update(extensions)
+        for other in refs:
+            if other["unused"] and (f"{other['id']}/{other['arch']}/{other['branch']}" in runtimes or any(other["id"] == point or other["id"].startswith(point + ".") for point in extension_points)):
+                other["unused"] = False
+                needed.append(other)
+
+    # The apps and the runtimes use every inode of their kind once
+    totals = {}
+    for kind in ("app", "runtime"):
+        kind_inodes = {}
+        for ref, (device, inodes) in zip(refs, usage):
+            if ref["kind"] == kind:
+                kind_inodes.update(((device, inode), size) for inode, size in inodes.items())
+        totals[kind] = sum(kind_inodes.values())
+
+    # Uninstalling the unused runtimes frees what no used ref shares with them
+    used_inodes = set()
+    unused_inodes = {}
+    for ref, (device, inodes) in zip(refs, usage):
+        if ref["unused"]:
+            unused_inodes.update(((device, inode), size) for inode, size in inodes.items())
+        else:
+            used_inodes.update((device, inode) for inode in inodes)
+    unused_size = sum(size for key, size in unused_inodes.items() if key not in used_inodes)
+
+    # The data of apps that aren't installed anywhere is left behind unless it was deleted with them
+    installed = {ref["id"] for ref in refs if ref["kind"] == "app"}
+    data = []
+    data_dir = app_data_path()
+    with profiler.span("app data usage"):
+        for app_id in sorted(os.listdir(data_dir)) if os.path.isdir(data_dir) else []:
+            if app_id not in installed:
+                data.append({"id": app_id, "size": disk_usage_cache.data_size(os.path.join(data_dir, app_id))})
+    disk_usage_cache.save([ref["deploy_dir"] for ref in refs], [os.path.join(data_dir, entry["id"]) for entry in data])
+
+    for ref in refs:
+        del ref["deploy_dir"]
+    return {"refs": refs, "data": data, "totals": totals, "unused_size": unused_size}
+
+# Function to get the jobs that uninstall the unused runtimes and delete the leftover data found by disk_usage, one per installation
+def cleanup_jobs(usage):
+    jobs = []
+    data = [entry["id"] for entry in usage["data"]]
+    for installation in ("user", "system"):
+        unused = [ref["id"] for ref in usage["refs"] if ref["unused"] and ref["installation"] == installation]
+        if installation == "user" and data:
+            jobs.append(FlatpakJob(f"Removing {len(unused)} unused runtimes and the data of {len(data)} removed apps", "cleanup", data, installation))
+        elif unused:
+            jobs.append(FlatpakJob(f"Removing {len(unused)} unused {installation} runtimes", "cleanup", [], installation))
+    return jobs
+
+# Function to get what the update check is cached for, which changes when the appstream data or an installed commit does
+def updates_key():
+    deploys = []
+    for installation_name, installation in (("user", user_installation_path()), ("system", system_installation_path())):
+        deploys += [ref["deploy_dir"] for ref in installation_deploys(installation, installation_name)]
+    return hashlib.sha256(json.dumps([appstream_fingerprint(find_appstream_files())[1], deploys]).encode()).hexdigest()
+
+# Function to list the installed refs that have updates, with their download size
+# Checking needs the remotes, so the last check is used again until the appstream data or the installed refs change, or unless forced
+def check_updates(force=False):
+    path = os.path.join(cache_dir(), "updates.json")
+    key = updates_key()
+    if not force:
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if data["key"] == key:
+                return data["updates"]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Ignoring the cached update check '{path}': {e}")
+
+    updates = []
+    for installation in ("user", "system"):
+        try:
+            with profiler.span("check updates", installation=installation):
+                installation_updates = get_backend().list_updates(installation)
+        except FlatpakError as e:
+            print(f"Failed to check the {installation} installation for updates: {e}")
+            return None
+        for application_id, ref, download_size in installation_updates:
+            updates.append({"application_id": application_id, "kind": ref.split("/")[0], "ref": ref, "installation": installation, "download_size": download_size})
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"key": key, "updates": updates}, f)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        print(f"Failed to cache the update check '{path}': {e}")
+    return updates
+
+# Function to get the jobs updating the apps that have updates but the skipped ones, one per installation
+# When no outdated app is skipped, everything that has updates is updated, runtimes included
+def update_jobs(updates, skipped):
+    jobs = []
+    for installation in ("user", "system"):
+        outdated = [update["application_id"] for update in updates if update["installation"] == installation and update["kind"] == "app"]
+        chosen = [application_id for application_id in outdated if application_id not in skipped]
+        if chosen and chosen != outdated:
+            jobs.append(FlatpakJob(f"Updating {', '.join(chosen)}", "update", chosen, installation))
+        elif any(update["installation"] == installation for update in updates) and chosen == outdated:
+            jobs.append(FlatpakJob(f"Updating the {installation} apps and runtimes", "update", [], installation))
+    return jobs
+
+# Error raised when a manifest can't be read
+class ManifestError(Exception):
+    pass
+
+# Function to read a manifest listing the apps that should be installed, from a TOML or JSON file
+# The apps are listed as IDs or as tables with an id and optionally a remote and a commit to pin, and the remotes as names and .flatpakrepo URLs:
+#   apps = ["org.mozilla.firefox", { id = "org.gnome.Calculator", commit = "0123abc..." }]
+#   [remotes]
+#   flathub = "https://dl.flathub.org/repo/flathub.flatpakrepo"
+def load_manifest(path):
+    try:
+        if path.endswith(".json"):
+            with open(path) as f:
+                data = json.load(f)
+        else:
+            import tomllib  # Only in Python 3.11 and later, JSON manifests work everywhere
+            with open(path, "rb") as f:
+                data = tomllib.load(f)
+    except ImportError:
+        raise ManifestError("TOML manifests need Python 3.11 or later, use a JSON manifest instead")
+    except (OSError, ValueError) as e:
+        raise ManifestError(f"Failed to read the manifest '{path}': {e}")
+
+    if not isinstance(data, dict):
+        raise ManifestError("The manifest must be a table with an apps list")
+    remotes = data.get("remotes", {})
+    if not isinstance(remotes, dict) or not all(isinstance(url, str) for url in remotes.values()):
+        raise ManifestError("The remotes of the manifest must map names to .flatpakrepo URLs")
+
+    if not isinstance(data.get("apps", []), list):
+        raise ManifestError("The apps of the manifest must be a list of app IDs or tables")
+    apps = []
+    for app in data.get("apps", []):
+        if isinstance(app, str):
+            app = {"id": app}
+        if not isinstance(app, dict) or not isinstance(app.get("id"), str) or not valid_app_id(app["id"]):
+            raise ManifestError(f"Invalid app in the manifest: {app!r}")
+        # The remote and the commit are passed to flatpak, so they must be text that can't be taken for an option
+        remote, commit = app.get("remote", "flathub"), app.get("commit", "")
+        if not isinstance(remote, str) or not isinstance(commit, str) or not remote or remote.startswith("-") or commit.startswith("-"):
+            raise ManifestError(f"Invalid remote or commit in the manifest: {app!r}")
+        apps.append({"id": app["id"], "remote": remote, "commit": commit})
+    return {"remotes": remotes, "apps": apps}
+
+# Function to get the commit an app is deployed from, None if it isn't installed there
+def installed_commit(installation, app_id):
+    active_dir = os.path.join(installation, "app", app_id, "current", "active")
+    if not os.path.isdir(active_dir):
+        return None
+    return os.path.basename(os.path.realpath(active_dir))
+
+# Function to work out what a sync has to do to make the installed apps match a manifest, given every installed app from list_installed_apps
+# Only apps installed for the user are removed, system-wide ones are left alone but count as installed
+def plan_sync(manifest, installed_apps, remotes):
+    installations = app_installations(installed_apps)
+    paths = {"user": user_installation_path(), "system": system_installation_path()}
+
+    wanted = {app["id"] for app in manifest["apps"]}
+    plan = {
+        "add_remotes": {name: url for name, url in manifest["remotes"].items() if name not in remotes},
+        "install": [],
+        "remove": sorted(app_id for app_id, installation in installations.items() if installation == "user" and app_id not in wanted),
+        "pin": {},
+        "remotes": {},
+    }
+    for app in manifest["apps"]:
+        installation = installations.get(app["id"])
+        if installation is None:
+            plan["install"].append(app["id"])
+            plan["remotes"][app["id"]] = app["remote"]
+        if app["commit"] and (installation is None or installed_commit(paths[installation], app["id"]) != app["commit"]):
+            if installation == "system":
+                print(f"Not pinning {app['id']}, it is installed system-wide")
+                continue
+            plan["pin"][app["id"]] = app["commit"]
+            plan["remotes"].setdefault(app["id"], app["remote"])
+    return plan
+
+# Function to estimate the download size of the apps a sync installs or moves to another commit
+# Runtimes they need aren't counted, and sizes the remote can't be asked for are left empty
+def estimate_downloads(plan):
+    sizes = {}
+    for app_id in plan["install"] + [app_id for app_id in plan["pin"] if app_id not in plan["install"]]:
+        try:
+            sizes[app_id] = parse_size(get_backend().remote_info(plan["remotes"][app_id], app_id)["download_size"])
+        except FlatpakError as e:
+            print(f"Failed to get the download size of {app_id}: {e}")
+            sizes[app_id] = None
+    return sizes
+
+# Function to search for apps, returning the results as JSON, best matches first
+# Results are looked up in the search cache first, so a cached query needs neither the catalog nor flatpak
+# A search that is cancelled, as told by the cancelled callback, returns None before it searches the catalog or flatpak
+def search_apps(query, cancelled=lambda: False):
+    query = query.strip().lower()  # Lowercase query for case-insensitive matching
+    normalized_query = normalize_query(query)
+    with profiler.span("search cache lookup", query=normalized_query):
+        results_json = search_cache.get(normalized_query, appstream_fingerprint(find_appstream_files())[1])
+    if results_json is not None:
+        return results_json
+    if cancelled():
+        return None
+
+    # A catalog being rebuilt in the background isn't waited for, the current one is searched meanwhile
+    with profiler.span("catalog refresh"):
+        catalog.refresh(blocking=False)
+    if not catalog.apps:
+        # Nothing has been downloaded yet, so fetch the appstream metadata once and index it
+        # A prefetch that is running is waited for, and what it downloaded isn't downloaded again
+        refresh_appstream(APPSTREAM_TTL)
+    if cancelled():
+        return None
+
+    if not catalog.apps:
+        # Fall back to asking flatpak if there is still no local metadata to index
+        return json.dumps(backend_search(query))
+
+    checksum, stale = catalog.checksum, catalog.stale
+    results = []
+    with profiler.span("catalog search", query=query):
+        for app in catalog.search(query):
+            results.append({"name": app["name"], "label": app["label"], "application_id": app["application_id"]})
+    results_json = json.dumps(results)
+    # Results from a snapshot don't match the local appstream data the cache is checked against
+    if not stale:
+        search_cache.put(normalized_query, checksum, results_json)
+    return results_json
+
+# Function to search through the backend when there is no local catalog
+def backend_search(query):
+    results = []
+    try:
+        for application_id, name, remotes in get_backend().search(query):
+            label = get_label("", False, remotes)
+
+            # Match query against the name or application ID
+            if query in name.lower() or query in application_id.lower():
+                results.append({"name": name, "label": label, "application_id": application_id})
+
+    except FlatpakError as e:
+        print(f"Error during search: {e}")
+    return results
+
+# Function to run a flatpak job to the end, printing its progress
+def run_job(job):
+    print(job.description)
+    ok = get_backend().run_transaction(job, lambda progress, status: print(f"{progress:>3}% {status}"))
+    return {"action": job.action, "installation": job.installation, "refs": job.refs, "ok": ok}
+
+# Command line subcommands, which never need Qt
+def cli_search(args):
+    results = json.loads(search_apps(" ".join(args.query)))
+    return [{"application_id": result["application_id"], "name": result["name"], "label": result["label"]} for result in results], True
+
+def cli_list(args):
+    apps = get_installed_apps().values()
+    return [{"application_id": app["ID"], "name": app["Name"], "installation": app["Installation"]} for app in sorted(apps, key=lambda app: app["Name"].lower())], True
+
+def cli_install(args):
+    result = run_job(FlatpakJob(f"Installing {', '.join(args.application_ids)}", "install", args.application_ids, remote=args.remote))
+    return [result], result["ok"]
+
+def cli_remove(args):
+    # Apps are removed from the installation they are in, like the Delete button does
+    installations = app_installations(list_installed_apps())
+    refs = {}
+    for application_id in args.application_ids:
+        refs.setdefault(installations.get(application_id, "user"), []).append(application_id)
+    results = [run_job(FlatpakJob(f"Uninstalling {', '.join(ids)}", "uninstall", ids, installation)) for installation, ids in refs.items()]
+    return results, all(result["ok"] for result in results)
+
+def cli_update(args):
+    if args.check:
+        updates = check_updates(force=True)
+        if updates is None:
+            return [], False
+        print(f"{len(updates)} updates to download, {format_size(sum(update['download_size'] for update in updates))} in all")
+        return [{"application_id": update["application_id"], "kind": update["kind"], "installation": update["installation"], "download_size": update["download_size"]} for update in updates], True
+    if args.application_ids:
+        # Apps are updated in the installation they are in, like they are removed
+        installations = app_installations(list_installed_apps())
+        refs = {}
+        for application_id in args.application_ids:
+            refs.setdefault(installations.get(application_id, "user"), []).append(application_id)
+        results = [run_job(FlatpakJob(f"Updating {', '.join(ids)}", "update", ids, installation)) for installation, ids in refs.items()]
+        return results, all(result["ok"] for result in results)
+
+    # Only the installations that have updates are updated
+    updates = check_updates()
+    if updates is None:
+        result = run_job(FlatpakJob("Updating apps", "update", []))
+        return [result], result["ok"]
+    results = [run_job(job) for job in update_jobs(updates, set())]
+    if not results:
+        print("Everything is up to date")
+    return results, all(result["ok"] for result in results)
+
+def cli_sync(args):
+    try:
+        manifest = load_manifest(args.manifest)
+        remotes = get_backend().list_remotes()
+    except (ManifestError, FlatpakError) as e:
+        print(e)
+        return [], False
+
+    plan = plan_sync(manifest, list_installed_apps(), remotes)
+    rows = [{"action": "add-remote", "target": name, "remote": name, "detail": url} for name, url in plan["add_remotes"].items()]
+    rows += [{"action": "install", "target": app_id, "remote": plan["remotes"][app_id], "detail": ""} for app_id in plan["install"]]
+    rows += [{"action": "remove", "target": app_id, "remote": "", "detail": ""} for app_id in plan["remove"]]
+    rows += [{"action": "pin", "target": app_id, "remote": plan["remotes"][app_id], "detail": commit} for app_id, commit in plan["pin"].items()]
+
+    if args.dry_run:
+        sizes = estimate_downloads(plan)
+        for row in rows:
+            # Apps that are installed and pinned are only counted once, on their install row
+            counted = row["action"] == "install" or (row["action"] == "pin" and row["target"] not in plan["install"])
+            size = sizes.get(row["target"]) if counted else None
+            row["download_size"] = format_size(size) if size is not None else ""
+        known = [size for size in sizes.values() if size is not None]
+        total = format_size(sum(known)) + (" or more" if len(known) < len(sizes) else "")
+        rows.append({"action": "total", "target": "", "remote": "", "detail": "", "download_size": total})
+        return rows, True
+
+    ok = True
+    for name, url in plan["add_remotes"].items():
+        try:
+            get_backend().add_remote(name, url)
+        except FlatpakError as e:
+            print(f"Failed to add the remote {name}: {e}")
+            ok = False
+    if ok and (plan["install"] or plan["remove"] or plan["pin"]):
+        job = FlatpakJob("Syncing apps with the manifest", "sync", plan["install"], removals=plan["remove"], commits=plan["pin"], remotes=plan["remotes"])
+        ok = run_job(job)["ok"]
+    for row in rows:
+        row["ok"] = ok
+    return rows, ok
+
+def cli_export(args):
+    # Apps are exported from the installation they are in, all of them if none are given
+    installations = {app["ID"]: app["Installation"] for app in get_installed_apps().values()}
+    app_ids = {}
+    for application_id in args.application_ids or sorted(installations):
+        if application_id not in installations:
+            print(f"{application_id} is not installed")
+            return [], False
+        app_ids.setdefault(installations[application_id], []).append(application_id)
+
+    rows = []
+    ok = True
+    for installation, ids in app_ids.items():
+        print(f"Exporting {', '.join(ids)} to {args.directory}")
+        try:
+            with profiler.span("export apps", apps=len(ids)):
+                get_backend().create_usb(installation, args.directory, ids)
+            exported = True
+        except FlatpakError as e:
+            print(f"Failed to export the {installation} apps: {e}")
+            exported = ok = False
+        rows += [{"application_id": application_id, "installation": installation, "ok": exported} for application_id in ids]
+    return rows, ok
+
+def cli_snapshot(args):
+    if args.import_path:
+        # Check the snapshot can be loaded before replacing the user's one with it
+        path = catalog_snapshot_paths()[0]
+        try:
+            snapshot = read_catalog_snapshot(args.import_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copyfile(args.import_path, path + ".tmp")
+            os.replace(path + ".tmp", path)
+        except (OSError, ValueError) as e:
+            print(f"Failed to import the catalog snapshot '{args.import_path}': {e}")
+            return [], False
+        return [{"path": path, "apps": len(snapshot["apps"]), "checksum": snapshot["checksum"]}], True
+
+    path = args.path or catalog_snapshot_paths()[0]
+    catalog.refresh()
+    if not catalog.apps or catalog.stale:
+        refresh_appstream(0)
+    if not catalog.apps or catalog.stale:
+        print("There is no local appstream metadata to snapshot")
+        return [], False
+    try:
+        with profiler.span("save catalog snapshot", path=path):
+            catalog.save_snapshot(path)
+    except OSError as e:
+        print(f"Failed to save the catalog snapshot '{path}': {e}")
+        return [], False
+    return [{"path": path, "apps": len(catalog.apps), "checksum": catalog.checksum}], True
+
+def cli_usage(args):
+    usage = disk_usage()
+    if args.clean:
+        results = [run_job(job) for job in cleanup_jobs(usage)]
+        return results, all(result["ok"] for result in results)
+
+    print(f"Unused runtimes use {format_size(usage['unused_size'])}, and removed apps left {format_size(sum(entry['size'] for entry in usage['data']))} of data")
+    rows = [{"kind": ref["kind"], "id": ref["id"], "branch": ref["branch"], "installation": ref["installation"], "size": ref["size"], "shared": ref["shared"], "unused": ref["unused"]} for ref in usage["refs"]]
+    rows += [{"kind": "data", "id": entry["id"], "branch": "", "installation": "user", "size": entry["size"], "shared": 0, "unused": True} for entry in usage["data"]]
+    return rows, True
+
+def cli_remotes(args):
+    if args.setup:
+        add_flatpak_remotes()
+    try:
+        return [{"name": remote} for remote in get_backend().list_remotes()], True
+    except FlatpakError as e:
+        print(f"Failed to list remotes: {e}")
+        return [], False
+
+CLI_COMMANDS = {
+    "search": cli_search,
+    "list": cli_list,
+    "install": cli_install,
+    "remove": cli_remove,
+    "update": cli_update,
+    "remotes": cli_remotes,
+    "sync": cli_sync,
+    "export": cli_export,
+    "snapshot": cli_snapshot,
+    "usage": cli_usage,
+}
+
+# Function to run Q-Paks from the command line without its window, returning the exit status
+# Rows are written to stdout as JSON or as tab separated values, everything else goes to stderr
+def cli(argv):
+    parser = argparse.ArgumentParser(prog="q-paks", description="Search, install, remove and update Flatpak apps without the Q-Paks window.")
+    parser.add_argument("--format", choices=["json", "tsv"], default="json", help="output format (default: json)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    search_parser = subparsers.add_parser("search", help="search the apps of the remotes")
+    search_parser.add_argument("query", nargs="+")
+    subparsers.add_parser("list", help="list the installed apps")
+    install_parser = subparsers.add_parser("install", help="install apps in a single transaction")
+    install_parser.add_argument("application_ids", nargs="+", metavar="application_id")
+    install_parser.add_argument("--remote", default="flathub")
+    remove_parser = subparsers.add_parser("remove", help="remove installed apps")
+    remove_parser.add_argument("application_ids", nargs="+", metavar="application_id")
+    update_parser = subparsers.add_parser("update", help="update the given installed apps, or all of them")
+    update_parser.add_argument("application_ids", nargs="*", metavar="application_id")
+    update_parser.add_argument("--check", action="store_true", help="only list the updates and their download size")
+    remotes_parser = subparsers.add_parser("remotes", help="list the user's remotes")
+    remotes_parser.add_argument("--setup", action="store_true", help="add the remotes Q-Paks uses first")
+    sync_parser = subparsers.add_parser("sync", help="install and remove apps to match a TOML or JSON manifest, in one go")
+    sync_parser.add_argument("manifest")
+    sync_parser.add_argument("--dry-run", action="store_true", help="only print what would be done and the download size")
+    export_parser = subparsers.add_parser("export", help="copy installed apps and their runtimes into a sideload directory, like flatpak create-usb")
+    export_parser.add_argument("directory")
+    export_parser.add_argument("application_ids", nargs="*", metavar="application_id")
+    snapshot_parser = subparsers.add_parser("snapshot", help="save the search catalog to a file other qubes can start from")
+    snapshot_parser.add_argument("path", nargs="?", help="where to save it (default: the user's catalog snapshot)")
+    snapshot_parser.add_argument("--import", dest="import_path", metavar="path", help="use this snapshot as the user's catalog snapshot instead")
+    usage_parser = subparsers.add_parser("usage", help="show the disk space used by the installed apps and runtimes, and by data removed apps left behind")
+    usage_parser.add_argument("--clean", action="store_true", help="uninstall the unused runtimes and delete the leftover data")
+    args = parser.parse_args(argv[1:])
+
+    # Point stdout at stderr, so the output isn't mixed with messages from Q-Paks or flatpak
+    sys.stdout.flush()
+    output = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    rows, ok = CLI_COMMANDS[args.command](args)
+    if args.format == "json":
+        json.dump(rows, output, indent=2)
+        output.write("\n")
+    else:
+        for row in rows:
+            output.write("\t".join(",".join(value) if isinstance(value, list) else str(value) for value in row.values()) + "\n")
+    output.flush()
+    return 0 if ok else 1
+
+# Function to check whether the command line asks for a subcommand rather than the window
+def cli_requested(argv):
+    args = [arg for arg in argv[1:] if arg != "--profile" and not arg.startswith("--profile-trace=")]
+    return len(args) > 0 and (args[0] in CLI_COMMANDS or args[0].startswith("--format"))
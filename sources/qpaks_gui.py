@@ -0,0 +1,1402 @@
+# Window of Q-Paks, built on the core in the qpaks module
+import signal
+import inspect
+from qpaks import *
+from PyQt5.QtCore import QObject, QThread, QTimer, QFileSystemWatcher, pyqtSignal, Qt, QAbstractListModel, QSortFilterProxyModel, QModelIndex, QEvent, QRect, QSize, QRunnable, QThreadPool
+from PyQt5.QtGui import QIcon, QFont, QFontMetrics, QColor, QImage, QPixmap, QPixmapCache
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QLineEdit, QDialog, QMessageBox, QMainWindow, QComboBox, QListView, QAbstractItemView, QStyledItemDelegate, QStyle, QStyleOptionButton, QStyleOptionViewItem, QProgressBar, QTextBrowser, QSplitter, QCheckBox
+
+# Thread to handle searching for apps on Flathub
+class SearchThread(QThread):
+    success = pyqtSignal(str)
+
+    def __init__(self, query):
+        super(SearchThread, self).__init__()
+        self.query = query.strip().lower()  # Lowercase query for case-insensitive matching
+        self.cancelled = False
+
+    # Mark the search as stale, so it emits nothing, and doesn't search the catalog if it hasn't started to yet
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        results_json = search_apps(self.query, lambda: self.cancelled)
+        if results_json is not None and not self.cancelled:
+            self.success.emit(results_json)
+
+# Thread to load the details of an app, first from the local appstream and then from the remote
+class DetailsThread(QThread):
+    success = pyqtSignal(str)
+
+    def __init__(self, application_id):
+        super(DetailsThread, self).__init__()
+        self.application_id = application_id
+        self.cancelled = False
+
+    # Mark the details as stale, so they are not emitted
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        app = catalog.apps.get(self.application_id)
+        if app is None:
+            self.emit_details({"name": self.application_id, "application_id": self.application_id, "error": "This app is not in the local appstream metadata."})
+            return
+
+        remote = app["remotes"][0]
+        key = f"{remote}/{app['ref']}"
+        checksum = app["digest"]
+        details = details_cache.get(key, checksum)
+        if details is not None:
+            self.emit_details(details)
+            return
+
+        details = {
+            "name": app["name"],
+            "summary": app["summary"],
+            "application_id": self.application_id,
+            "license": app["license"],
+            "label": app["label"],
+            "remote": remote,
+            "ref": app["ref"],
+        }
+        try:
+            with profiler.span("read appstream details", application_id=self.application_id):
+                component = read_appstream_component(app["path"], self.application_id)
+            if component is not None:
+                details.update(appstream_details(component))
+        except (OSError, ValueError) as e:
+            print(f"Failed to read the appstream details of {self.application_id}: {e}")
+        self.emit_details(details)
+
+        # The remote's sizes and permissions need the network, so they are filled in afterwards
+        try:
+            details.update(get_backend().remote_info(remote, app["ref"]))
+            details_cache.put(key, checksum, details, True)
+        except FlatpakError as e:
+            print(f"Failed to get the remote info of {app['ref']}: {e}")
+            details["remote_info_error"] = "Sizes and permissions are unavailable without a connection to the remote."
+            details_cache.put(key, checksum, details, False)
+        self.emit_details(details)
+
+    def emit_details(self, details):
+        if not self.cancelled:
+            self.success.emit(json.dumps(details))
+
+# Function to render the details of an app as HTML for the details pane
+def details_html(details):
+    parts = [f"<h2>{html.escape(details['name'])}</h2>"]
+    if details.get("summary"):
+        parts.append(f"<p><i>{html.escape(details['summary'])}</i></p>")
+    if details.get("error"):
+        parts.append(f"<p>{html.escape(details['error'])}</p>")
+
+    rows = [
+        ("Version", details.get("version")),
+        ("License", details.get("license")),
+        ("Developer", details.get("developer")),
+        ("Download size", details.get("download_size", "Loading ...")),
+        ("Installed size", details.get("installed_size", "Loading ...")),
+        ("Runtime", details.get("runtime")),
+        ("Remote", details.get("remote")),
+        ("Ref", details.get("ref")),
+    ]
+    if "remote_info_error" in details or "error" in details:
+        rows = [(title, value) for title, value in rows if value != "Loading ..."]
+    parts.append("<table>" + "".join(f"<tr><td><b>{title}</b></td><td>{html.escape(value)}</td></tr>" for title, value in rows if value) + "</table>")
+    if details.get("remote_info_error"):
+        parts.append(f"<p>{html.escape(details['remote_info_error'])}</p>")
+
+    if details.get("permissions"):
+        parts.append("<h3>Permissions</h3><ul>" + "".join(f"<li>{html.escape(permission)}</li>" for permission in details["permissions"]) + "</ul>")
+    if details.get("description"):
+        parts.append("<h3>Description</h3>" + details["description"])
+    if details.get("releases"):
+        parts.append("<h3>Releases</h3>")
+        for release in details["releases"]:
+            parts.append(f"<p><b>{html.escape(release['version'])}</b> {html.escape(release['date'])}</p>{release['description']}")
+
+    links = [f"<a href=\"https://flathub.org/apps/{html.escape(details['application_id'])}\">Flathub</a>"]
+    if details.get("homepage"):
+        links.append(f"<a href=\"{html.escape(details['homepage'])}\">Homepage</a>")
+    parts.append(f"<p>{' | '.join(links)}</p>")
+    return "".join(parts)
+
+# Delay between the last keystroke and starting a search
+SEARCH_DEBOUNCE_MS = 75
+
+# Entries of the "Filter by" combo box, as (text, label) pairs
+SEARCH_FILTERS = [
+    ("All Apps", ""),
+    ("FOSS Apps", "FOSS"),
+    ("Verified Apps", "Verified"),
+    ("Verified & FOSS Apps", "Verified & FOSS"),
+]
+
+# Dialog for searching Flathub for apps
+class SearchDialog(QDialog):
+    def __init__(self, job_queue):
+        super(SearchDialog, self).__init__()
+        self.job_queue = job_queue
+        self.setWindowTitle("Search Flathub for apps")
+        self.setMinimumWidth(600)
+        self.setMinimumHeight(300)
+
+        self.input = QLineEdit()
+        self.input.setPlaceholderText("Search Flathub for apps")
+        self.input.textChanged.connect(self.input_changed)
+        self.input.returnPressed.connect(self.search_clicked)
+        self.search_button = QPushButton("Search")
+        self.search_button.clicked.connect(self.search_clicked)
+
+        # Searches start once typing pauses, rather than on every keystroke
+        self.debounce_timer = QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.debounce_timer.timeout.connect(self.search_clicked)
+
+        self.t = None  # The search thread whose results will be shown
+        self.threads = []  # Search threads that are still running, including cancelled ones
+
+        self.filter_combo = QComboBox()
+        for text, label in SEARCH_FILTERS:
+            self.filter_combo.addItem(text, label)
+        self.filter_combo.currentIndexChanged.connect(self.filter_changed)
+
+        # Layout for filters
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("Filter by:"))
+        filter_layout.addWidget(self.filter_combo)
+
+        # Layout for search input and button
+        search_layout = QHBoxLayout()
+        search_layout.addWidget(self.input, stretch=1)
+        search_layout.addWidget(self.search_button)
+
+        # View displaying search results, which only paints the visible rows
+        self.results_model = SearchResultsModel()
+        self.filter_model = LabelFilterProxyModel()
+        self.filter_model.setSourceModel(self.results_model)
+        self.results_delegate = SearchAppDelegate(self)
+        self.results_delegate.info.connect(self.info_clicked)
+        self.results_delegate.install.connect(self.install_clicked)
+        self.results_view = QListView()
+        self.results_view.setModel(self.filter_model)
+        self.results_view.setItemDelegate(self.results_delegate)
+        self.results_view.setUniformItemSizes(True)
+        self.results_view.setIconSize(QSize(ICON_SIZE, ICON_SIZE))
+        self.results_view.setSelectionMode(QAbstractItemView.NoSelection)
+
+        # Pane showing the details of the app whose Info button was clicked, read from the local appstream and the remote
+        self.details_view = QTextBrowser()
+        self.details_view.setOpenExternalLinks(True)
+        self.details_view.hide()
+        self.details_thread = None
+        self.splitter = QSplitter(Qt.Horizontal)
+        self.splitter.addWidget(self.results_view)
+        self.splitter.addWidget(self.details_view)
+        self.splitter.setStretchFactor(0, 3)
+        self.splitter.setStretchFactor(1, 2)
+
+        self.status_label = QLabel("App not found")
+        self.status_label.hide()
+        self.searched = False  # Whether the view holds the results of a search
+
+        # Ticked apps are installed together, so shared runtimes are only resolved and downloaded once
+        self.install_selected_button = QPushButton("Install Selected")
+        self.install_selected_button.setEnabled(False)
+        self.install_selected_button.clicked.connect(self.install_selected_clicked)
+        self.results_model.checked_changed.connect(self.checked_changed)
+
+        # Layout for the buttons under the results
+        buttons_layout = QHBoxLayout()
+        buttons_layout.addStretch()
+        buttons_layout.addWidget(self.install_selected_button)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(filter_layout)
+        layout.addLayout(search_layout)
+        layout.addWidget(self.status_label)
+        layout.addWidget(self.splitter, stretch=1)
+        layout.addLayout(buttons_layout)
+
+    # Slot triggered when the search text is edited
+    def input_changed(self, text):
+        self.debounce_timer.start()
+
+    # Slot triggered when the search button is clicked, Enter is pressed or typing pauses
+    def search_clicked(self):
+        self.debounce_timer.stop()
+        query = self.input.text().strip().lower()
+
+        # Drop whatever the previous search would still have produced
+        if self.t is not None:
+            self.t.cancel()
+            self.t = None
+
+        if not query:
+            self.search_button.setText("Search")
+            self.clear_results()
+            return
+
+        print(f"Searching for: {query}")
+        self.search_button.setText("Searching ...")
+
+        t = SearchThread(query)
+        t.success.connect(lambda results_json, t=t: self.search_finished(t, results_json))
+        t.finished.connect(lambda t=t: self.threads.remove(t))
+        self.threads.append(t)
+        self.t = t
+        t.start()
+
+    # Slot triggered when a search thread has results, which are ignored if the search is stale
+    def search_finished(self, t, results_json):
+        if t is not self.t:
+            return
+
+        self.t = None
+        self.search_button.setText("Search")
+        self.search_results(results_json)
+
+    # Cancel running searches and wait for them before the dialog goes away
+    def done(self, r):
+        self.debounce_timer.stop()
+        for t in self.threads:
+            t.cancel()
+        for t in list(self.threads):
+            t.wait()
+        search_cache.save()
+        super(SearchDialog, self).done(r)
+
+    # Clear previous results from the view
+    def clear_results(self):
+        self.results_model.set_results([])
+        self.update_filter_counts(None)
+        self.searched = False
+        self.status_label.hide()
+
+    # Slot to handle search results
+    def search_results(self, results_json):
+        with profiler.span("render search results"):
+            results = json.loads(results_json)
+            self.results_model.set_results(results)
+            self.update_filter_counts(results)
+            self.searched = True
+            self.status_label.setVisible(self.filter_model.rowCount() == 0)
+            self.results_view.scrollToTop()
+
+    # Slot triggered when another filter is picked, which only re-filters the results already shown
+    def filter_changed(self, i):
+        self.filter_model.set_label(self.filter_combo.itemData(i))
+        self.status_label.setVisible(self.searched and self.filter_model.rowCount() == 0)
+
+    # Show the number of results matching each filter next to its name
+    def update_filter_counts(self, results):
+        for i, (text, label) in enumerate(SEARCH_FILTERS):
+            if results is None:
+                self.filter_combo.setItemText(i, text)
+            else:
+                count = sum(1 for result in results if not label or result["label"] == label)
+                self.filter_combo.setItemText(i, f"{text} ({count})")
+
+    # Show the app's details in the details pane when the Info button is clicked
+    def info_clicked(self, application_id, name):
+        if self.details_thread is not None:
+            self.details_thread.cancel()
+
+        self.details_view.setHtml(f"<h2>{html.escape(name)}</h2><p>Loading ...</p>")
+        self.details_view.show()
+
+        t = DetailsThread(application_id)
+        t.success.connect(lambda details_json, t=t: self.details_loaded(t, details_json))
+        t.finished.connect(lambda t=t: self.threads.remove(t))
+        self.threads.append(t)
+        self.details_thread = t
+        t.start()
+
+    # Slot triggered when a details thread has loaded more details, which are ignored if another app was picked since
+    def details_loaded(self, t, details_json):
+        if t is not self.details_thread:
+            return
+        with profiler.span("render details"):
+            self.details_view.setHtml(details_html(json.loads(details_json)))
+
+    # Queue installing the app when the Install button is clicked
+    def install_clicked(self, application_id, name):
+        print(f"Installing: {name}")
+        self.job_queue.install([application_id])
+
+    # Show how many apps are ticked on the Install Selected button
+    def checked_changed(self):
+        count = len(self.results_model.checked)
+        self.install_selected_button.setEnabled(count > 0)
+        self.install_selected_button.setText(f"Install Selected ({count})" if count else "Install Selected")
+
+    # Queue installing every ticked app in a single flatpak transaction
+    def install_selected_clicked(self):
+        application_ids = sorted(self.results_model.checked)
+        print(f"Installing: {', '.join(application_ids)}")
+        self.job_queue.install(application_ids)
+        self.results_model.clear_checked()
+
+# Size app icons are shown at, and the limit of the pixmap cache holding them, which drops the least recently used ones beyond it
+ICON_SIZE = 32
+ICON_CACHE_KB = 8 * 1024
+ICON_THREADS = 2
+
+# Sizes of the exported icons of installed apps, in order of preference
+ICON_THEME_SIZES = ["64x64", "128x128", "48x48", "256x256", "512x512"]
+
+# Function to find the icon of an app among the icons exported by installed apps and the appstream icon cache
+def find_icon(application_id):
+    candidates = []
+    for installation in (user_installation_path(), system_installation_path()):
+        icons_dir = os.path.join(installation, "exports", "share", "icons", "hicolor")
+        candidates += [os.path.join(icons_dir, size, "apps", f"{application_id}.png") for size in ICON_THEME_SIZES]
+        candidates.append(os.path.join(icons_dir, "scalable", "apps", f"{application_id}.svg"))
+    for remote, path in find_appstream_files():
+        candidates += [os.path.join(os.path.dirname(path), "icons", size, f"{application_id}.png") for size in ("64x64", "128x128")]
+
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+# Task reading, decoding and scaling an app icon on the icon thread pool
+class IconTask(QRunnable):
+    def __init__(self, loader, application_id, size):
+        super(IconTask, self).__init__()
+        self.loader = loader
+        self.application_id = application_id
+        self.size = size
+
+    def run(self):
+        # Rows scrolled past or replaced by another search don't need their icon anymore
+        if self.application_id not in self.loader.pending:
+            return
+
+        image = QImage()
+        with profiler.span("load icon", application_id=self.application_id):
+            path = find_icon(self.application_id)
+            if path and image.load(path):
+                image = image.scaled(self.size, self.size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self.loader.image_loaded.emit(self.application_id, image)
+
+# Loader of app icons, which decodes them off the GUI thread and keeps them in the pixmap cache
+class IconLoader(QObject):
+    loaded = pyqtSignal(str)
+    image_loaded = pyqtSignal(str, QImage)
+
+    def __init__(self):
+        super(IconLoader, self).__init__()
+        QPixmapCache.setCacheLimit(ICON_CACHE_KB)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(ICON_THREADS)
+        self.ratio = QApplication.instance().devicePixelRatio()
+        self.pending = {}  # Application IDs with a queued or running task, to the set of what asked for their icon
+        self.missing = set()  # Application IDs without an icon, which aren't looked up again
+        self.requests = 0
+        self.image_loaded.connect(self.image_finished)
+
+        # Shown until the icon is loaded, so rows keep their layout when it arrives
+        self.placeholder = QPixmap(round(ICON_SIZE * self.ratio), round(ICON_SIZE * self.ratio))
+        self.placeholder.fill(Qt.transparent)
+        self.placeholder.setDevicePixelRatio(self.ratio)
+
+    # Get the icon of an app if it's cached, otherwise queue loading it for the requester and get the placeholder
+    def icon(self, application_id, requester):
+        pixmap = QPixmapCache.find(f"icon:{application_id}")
+        if pixmap is not None:
+            return pixmap
+
+        if application_id in self.pending:
+            self.pending[application_id].add(requester)
+        elif application_id not in self.missing:
+            self.pending[application_id] = {requester}
+            # The latest requests are for the rows on screen now, so they go first
+            self.requests += 1
+            self.pool.start(IconTask(self, application_id, round(ICON_SIZE * self.ratio)), self.requests)
+        return self.placeholder
+
+    # Forget the queued icons of a requester, or of everything, which are queued again if they're still shown
+    # Icons that something else asked for too are still loaded
+    def cancel_pending(self, requester=None):
+        for application_id in list(self.pending):
+            requesters = self.pending[application_id]
+            requesters.discard(requester)
+            if requester is None or not requesters:
+                del self.pending[application_id]
+
+    # Slot triggered when a task decoded an icon, which is turned into a pixmap and cached on the GUI thread
+    def image_finished(self, application_id, image):
+        self.pending.pop(application_id, None)
+        if image.isNull():
+            self.missing.add(application_id)
+            return
+
+        pixmap = QPixmap.fromImage(image)
+        pixmap.setDevicePixelRatio(self.ratio)
+        QPixmapCache.insert(f"icon:{application_id}", pixmap)
+        self.loaded.emit(application_id)
+
+    # Drop the queued tasks and wait for the running ones
+    def wait(self):
+        self.cancel_pending()
+        self.pool.clear()
+        self.pool.waitForDone()
+
+icon_loader = None
+
+# Function to get the icon loader shared by the whole application
+def get_icon_loader():
+    global icon_loader
+    if icon_loader is None:
+        icon_loader = IconLoader()
+    return icon_loader
+
+# Model holding the search results, so the view only renders the rows that are visible
+class SearchResultsModel(QAbstractListModel):
+    LabelRole = Qt.UserRole + 1
+    ApplicationIdRole = Qt.UserRole + 2
+
+    checked_changed = pyqtSignal()
+
+    def __init__(self):
+        super(SearchResultsModel, self).__init__()
+        self.results = []
+        self.rows = {}  # Row of every application ID, to repaint it when its icon is loaded
+        self.checked = set()  # Application IDs ticked for installing, kept across searches
+        get_icon_loader().loaded.connect(self.icon_loaded)
+
+    # Replace all the results at once
+    def set_results(self, results):
+        get_icon_loader().cancel_pending(self)
+        self.beginResetModel()
+        self.results = results
+        self.rows = {result["application_id"]: row for row, result in enumerate(results)}
+        self.endResetModel()
+
+    # Slot triggered when an icon is loaded
+    def icon_loaded(self, application_id):
+        row = self.rows.get(application_id)
+        if row is not None:
+            self.dataChanged.emit(self.index(row), self.index(row), [Qt.DecorationRole])
+
+    # Untick every app
+    def clear_checked(self):
+        self.checked = set()
+        if self.results:
+            self.dataChanged.emit(self.index(0), self.index(len(self.results) - 1), [Qt.CheckStateRole])
+        self.checked_changed.emit()
+
+    def flags(self, index):
+        return super(SearchResultsModel, self).flags(index) | Qt.ItemIsUserCheckable
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.CheckStateRole:
+            return False
+        application_id = self.results[index.row()]["application_id"]
+        if value == Qt.Checked:
+            self.checked.add(application_id)
+        else:
+            self.checked.discard(application_id)
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+        self.checked_changed.emit()
+        return True
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.results)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        result = self.results[index.row()]
+        if role == Qt.DisplayRole:
+            return result["name"]
+        elif role == Qt.ToolTipRole or role == self.ApplicationIdRole:
+            return result["application_id"]
+        elif role == self.LabelRole:
+            return result["label"]
+        elif role == Qt.CheckStateRole:
+            return Qt.Checked if result["application_id"] in self.checked else Qt.Unchecked
+        elif role == Qt.DecorationRole:
+            return get_icon_loader().icon(result["application_id"], self)
+        return None
+
+# Proxy model hiding the search results that don't have the selected label
+class LabelFilterProxyModel(QSortFilterProxyModel):
+    def __init__(self):
+        super(LabelFilterProxyModel, self).__init__()
+        self.label = ""
+
+    # Change the label to filter by, an empty label shows every result
+    def set_label(self, label):
+        self.label = label
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if not self.label:
+            return True
+        index = self.sourceModel().index(source_row, 0, source_parent)
+        return index.data(SearchResultsModel.LabelRole) == self.label
+
+# Delegate painting a search result row with its Info and Install buttons
+class SearchAppDelegate(QStyledItemDelegate):
+    info = pyqtSignal(str, str)
+    install = pyqtSignal(str, str)
+
+    MARGIN = 6
+    SPACING = 6
+
+    def __init__(self, parent=None):
+        super(SearchAppDelegate, self).__init__(parent)
+        self.pressed = None  # (row, button) currently held down
+
+    # Get the rectangles of the Info and Install buttons for a row
+    def button_rects(self, option):
+        style = QApplication.style()
+        rects = {}
+        right = option.rect.right() - self.MARGIN
+        for button, text in (("install", "Install"), ("info", "Info")):
+            button_option = QStyleOptionButton()
+            button_option.text = text
+            size = style.sizeFromContents(QStyle.CT_PushButton, button_option, option.fontMetrics.size(Qt.TextShowMnemonic, text))
+            rect = QRect(0, 0, size.width(), size.height())
+            rect.moveRight(right)
+            rect.moveTop(option.rect.top() + (option.rect.height() - size.height()) // 2)
+            rects[button] = rect
+            right = rect.left() - self.SPACING
+        return rects
+
+    def paint(self, painter, option, index):
+        option = QStyleOptionViewItem(option)
+        self.initStyleOption(option, index)
+        style = QApplication.style()
+        painter.save()
+
+        # Draw the background and check box without the default text
+        option.text = ""
+        style.drawControl(QStyle.CE_ItemViewItem, option, painter, option.widget)
+
+        rects = self.button_rects(option)
+        text_rect = style.subElementRect(QStyle.SE_ItemViewItemText, option, option.widget)
+        text_rect.setLeft(text_rect.left() + self.MARGIN)
+        text_rect.setRight(rects["info"].left() - self.SPACING)
+
+        bold = QFont(option.font)
+        bold.setBold(True)
+        painter.setFont(bold)
+        name = index.data(Qt.DisplayRole)
+        name = QFontMetrics(bold).elidedText(name, Qt.ElideRight, text_rect.width())
+        painter.drawText(text_rect, Qt.AlignVCenter | Qt.AlignLeft, name)
+
+        label = index.data(SearchResultsModel.LabelRole)
+        if label:
+            label_rect = text_rect.adjusted(QFontMetrics(bold).horizontalAdvance(name) + self.SPACING, 0, 0, 0)
+            painter.setPen(QColor("green"))
+            painter.drawText(label_rect, Qt.AlignVCenter | Qt.AlignLeft, f"({label})")
+
+        painter.setFont(option.font)
+        for button, text in (("info", "Info"), ("install", "Install")):
+            button_option = QStyleOptionButton()
+            button_option.rect = rects[button]
+            button_option.text = text
+            button_option.state = QStyle.State_Enabled
+            if self.pressed == (index.row(), button):
+                button_option.state |= QStyle.State_Sunken
+            else:
+                button_option.state |= QStyle.State_Raised
+            style.drawControl(QStyle.CE_PushButton, button_option, painter, option.widget)
+
+        painter.restore()
+
+    def sizeHint(self, option, index):
+        button_option = QStyleOptionButton()
+        button_option.text = "Install"
+        size = QApplication.style().sizeFromContents(QStyle.CT_PushButton, button_option, option.fontMetrics.size(Qt.TextShowMnemonic, "Install"))
+        return QSize(0, max(size.height(), ICON_SIZE) + 2 * self.MARGIN)
+
+    # Turn clicks on the painted buttons into info and install signals, the check box is handled by Qt
+    def editorEvent(self, event, model, option, index):
+        if event.type() not in (QEvent.MouseButtonPress, QEvent.MouseButtonRelease) or event.button() != Qt.LeftButton:
+            return super(SearchAppDelegate, self).editorEvent(event, model, option, index)
+
+        clicked = None
+        for button, rect in self.button_rects(option).items():
+            if rect.contains(event.pos()):
+                clicked = button
+
+        if event.type() == QEvent.MouseButtonPress:
+            self.pressed = (index.row(), clicked) if clicked else None
+            if clicked is None:
+                return super(SearchAppDelegate, self).editorEvent(event, model, option, index)
+            return True
+
+        was_pressed = self.pressed
+        self.pressed = None
+        if clicked is None or was_pressed != (index.row(), clicked):
+            return super(SearchAppDelegate, self).editorEvent(event, model, option, index)
+
+        name = index.data(Qt.DisplayRole)
+        application_id = index.data(SearchResultsModel.ApplicationIdRole)
+        if clicked == "info":
+            self.info.emit(application_id, name)
+        else:
+            self.install.emit(application_id, name)
+        return True
+
+# Thread running a flatpak job non-interactively and reporting its progress
+class JobThread(QThread):
+    progress = pyqtSignal(int, str)
+
+    def __init__(self, job):
+        super(JobThread, self).__init__()
+        self.job = job
+        self.ok = False
+
+    def run(self):
+        self.ok = get_backend().run_transaction(self.job, self.progress.emit)
+
+# Queue running flatpak jobs one at a time, since flatpak locks the installation during a transaction
+class JobQueue(QObject):
+    job_added = pyqtSignal(object)
+    job_changed = pyqtSignal(object)
+    job_finished = pyqtSignal(object)
+
+    def __init__(self):
+        super(JobQueue, self).__init__()
+        self.jobs = []  # Jobs waiting to run
+        self.running = None
+        self.t = None
+
+    # Queue installing apps from Flathub
+    def install(self, application_ids):
+        return self.add(FlatpakJob(f"Installing {', '.join(application_ids)}", "install", list(application_ids)))
+
+    # Queue uninstalling an app from the user or system installation
+    def uninstall(self, application_id, installation="user"):
+        return self.add(FlatpakJob(f"Uninstalling {application_id}", "uninstall", [application_id], installation))
+
+    # Add a job to the end of the queue
+    def add(self, job):
+        print(f"Queued: {job.description}")
+        self.jobs.append(job)
+        self.job_added.emit(job)
+        self.start_next()
+        return job
+
+    # Cancel a job, stopping flatpak if it is already running
+    def cancel(self, job):
+        if job in self.jobs:
+            self.jobs.remove(job)
+            job.state = "cancelled"
+            job.status = "Cancelled"
+            self.job_finished.emit(job)
+        elif job is self.running:
+            job.cancelled = True
+            job.status = "Cancelling ..."
+            self.job_changed.emit(job)
+            if job.abort is not None:
+                job.abort()
+
+    # Cancel every job and wait for the running one to stop
+    def cancel_all(self):
+        for job in list(self.jobs):
+            self.cancel(job)
+        if self.running is not None:
+            self.cancel(self.running)
+            self.t.wait()
+
+    # Whether a job is running or waiting to run
+    def busy(self):
+        return self.running is not None or len(self.jobs) > 0
+
+    # Start the next job if none is running
+    def start_next(self):
+        if self.running is not None or not self.jobs:
+            return
+
+        job = self.jobs.pop(0)
+        job.state = "running"
+        job.status = "Starting ..."
+        self.running = job
+        self.job_changed.emit(job)
+
+        self.t = JobThread(job)
+        self.t.progress.connect(self.job_progress)
+        self.t.finished.connect(self.thread_finished)
+        self.t.start()
+
+    # Slot to record the progress reported by the running job
+    def job_progress(self, progress, status):
+        job = self.running
+        if job is None or job.cancelled:
+            return
+        job.progress = progress
+        job.status = status
+        self.job_changed.emit(job)
+
+    # Slot triggered when the running job's flatpak process exits
+    def thread_finished(self):
+        job = self.running
+        ok = self.t.ok
+        self.running = None
+        self.t = None
+
+        if job.cancelled:
+            job.state = "cancelled"
+            job.status = "Cancelled"
+        elif ok:
+            job.state = "done"
+            job.progress = 100
+            job.status = "Done"
+        else:
+            job.state = "failed"
+            print(f"Failed: {job.description}: {job.status}")
+            job.status = f"Failed: {job.status}"
+
+        self.job_finished.emit(job)
+        self.start_next()
+
+# Widget showing the progress of a job with a button to cancel it
+class JobWidget(QWidget):
+    cancel = pyqtSignal(object)
+    dismiss = pyqtSignal(object)
+
+    def __init__(self, job):
+        super(JobWidget, self).__init__()
+
+        self.job = job
+
+        description = QLabel(self.job.description)
+        description.setStyleSheet("QLabel { font-weight: bold }")
+        self.status = QLabel()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel_clicked)
+
+        top_layout = QHBoxLayout()
+        top_layout.addWidget(description)
+        top_layout.addStretch()
+        top_layout.addWidget(self.cancel_button)
+
+        layout = QVBoxLayout()
+        layout.addLayout(top_layout)
+        layout.addWidget(self.progress_bar)
+        layout.addWidget(self.status)
+        self.setLayout(layout)
+
+        self.refresh()
+
+    # Show the current state of the job
+    def refresh(self):
+        self.progress_bar.setValue(self.job.progress)
+        self.status.setText(QFontMetrics(self.status.font()).elidedText(self.job.status, Qt.ElideRight, 500))
+        if self.job.state in ("failed", "cancelled"):
+            self.cancel_button.setText("Dismiss")
+
+    # Cancel the job, or remove it from the list once it is over
+    def cancel_clicked(self):
+        if self.job.state in ("queued", "running"):
+            self.cancel.emit(self.job)
+        else:
+            self.dismiss.emit(self.job)
+
+# Widget listing the queued and running jobs
+class JobsWidget(QWidget):
+    def __init__(self, job_queue):
+        super(JobsWidget, self).__init__()
+
+        self.job_queue = job_queue
+        self.job_queue.job_added.connect(self.job_added)
+        self.job_queue.job_changed.connect(self.job_changed)
+        self.job_queue.job_finished.connect(self.job_finished)
+        self.widgets = {}
+
+        self.layout = QVBoxLayout()
+        self.layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(self.layout)
+        self.hide()
+
+    def job_added(self, job):
+        widget = JobWidget(job)
+        widget.cancel.connect(self.job_queue.cancel)
+        widget.dismiss.connect(self.remove_job)
+        self.widgets[job] = widget
+        self.layout.addWidget(widget)
+        self.show()
+
+    def job_changed(self, job):
+        if job in self.widgets:
+            self.widgets[job].refresh()
+
+    # Keep failed and cancelled jobs on screen until they are dismissed
+    def job_finished(self, job):
+        if job.state == "done":
+            self.remove_job(job)
+        else:
+            self.job_changed(job)
+
+    def remove_job(self, job):
+        widget = self.widgets.pop(job, None)
+        if widget:
+            widget.deleteLater()
+        if not self.widgets:
+            self.hide()
+
+# Widget representing an installed app with options to run or delete it
+class InstalledApp(QWidget):
+    run = pyqtSignal(str)
+    delete = pyqtSignal(str)
+    update_toggled = pyqtSignal()
+
+    def __init__(self, app_details):
+        super(InstalledApp, self).__init__()
+
+        self.app_details = app_details
+
+        self.icon = QLabel()
+        self.icon.setFixedSize(ICON_SIZE, ICON_SIZE)
+        self.update_icon()
+
+        name = QLabel(self.app_details["Name"])
+        name.setStyleSheet("QLabel { font-weight: bold }")
+
+        # Disk space used by the app, filled in once it has been accounted
+        self.size = QLabel()
+        self.size.setStyleSheet("QLabel { color: gray }")
+
+        # Shown when the app has an update, which is selected for the Update button until unchecked
+        self.update_check = QCheckBox()
+        self.update_check.setChecked(True)
+        self.update_check.setVisible(False)
+        self.update_check.toggled.connect(self.update_toggled)
+
+        self.run_button = QPushButton("Run")
+        self.run_button.clicked.connect(self.run_clicked)
+
+        self.delete_button = QPushButton("Delete")
+        self.delete_button.clicked.connect(self.delete_clicked)
+
+        layout = QHBoxLayout()
+        layout.addWidget(self.icon)
+        layout.addWidget(name)
+        layout.addWidget(self.size)
+        layout.addStretch()
+        layout.addWidget(self.update_check)
+        layout.addWidget(self.run_button)
+        layout.addWidget(self.delete_button)
+
+        self.setLayout(layout)
+
+    # Show the disk space only the app uses, and what it shares with its runtimes and other apps
+    def set_usage(self, size, shared):
+        self.size.setText(format_size(size))
+        self.size.setToolTip(f"{format_size(size)} used only by {self.app_details['Name']}, and {format_size(shared)} shared with other apps and runtimes")
+
+    # Show whether the app has an update, and how much it downloads
+    def set_update(self, download_size):
+        self.update_check.setVisible(download_size is not None)
+        if download_size is not None:
+            self.update_check.setText(f"Update ({format_size(download_size)})")
+
+    # Whether the app has an update that was unchecked, so the Update button skips it
+    def update_skipped(self):
+        return self.update_check.isVisibleTo(self) and not self.update_check.isChecked()
+
+    # Show the icon of the app, or keep its space until it's loaded
+    def update_icon(self):
+        self.icon.setPixmap(get_icon_loader().icon(self.app_details["ID"], self))
+
+    # Emit a signal to run the app when the Run button is clicked
+    def run_clicked(self):
+        print(f"Running: {self.app_details['ID']}")
+        self.run.emit(self.app_details["ID"])
+
+    # Emit a signal to delete the app when the Delete button is clicked
+    def delete_clicked(self):
+        d = QMessageBox()
+        d.setText(f"Are you sure you want to delete {self.app_details['Name']}?")
+        d.setStandardButtons(QMessageBox.Yes | QMessageBox.Cancel)
+        ret = d.exec_()
+
+        if ret == QMessageBox.Yes:
+            self.delete.emit(self.app_details["ID"])
+
+# Thread to retrieve the list of installed apps without blocking the GUI
+class InstalledAppsThread(QThread):
+    success = pyqtSignal(str)
+
+    def run(self):
+        with profiler.span("read installed apps"):
+            installed_apps = get_installed_apps()
+        self.success.emit(json.dumps(installed_apps))
+
+# Thread to account the disk usage of the installations without blocking the GUI
+class DiskUsageThread(QThread):
+    success = pyqtSignal(str)
+
+    def run(self):
+        self.success.emit(json.dumps(disk_usage()))
+
+# Thread to check for updates without blocking the GUI, which only asks the remotes when something changed since the last check
+class UpdatesThread(QThread):
+    success = pyqtSignal(str)
+
+    def run(self):
+        self.success.emit(json.dumps(check_updates()))
+
+# Thread to add the Flatpak remotes without blocking the GUI
+class RemotesThread(QThread):
+    def run(self):
+        add_flatpak_remotes()
+
+# Thread to refresh stale appstream metadata and build the catalog in the background, so searches don't wait for either
+class AppstreamThread(QThread):
+    status = pyqtSignal(str)
+
+    def run(self):
+        timestamp = appstream_timestamp()
+        stale = timestamp is None or time.time() - timestamp > APPSTREAM_TTL
+        self.status.emit(json.dumps({"timestamp": timestamp, "updating": stale}))
+        with profiler.span("prefetch appstream", stale=stale):
+            refresh_appstream(APPSTREAM_TTL)
+        self.status.emit(json.dumps({"timestamp": appstream_timestamp(), "updating": False}))
+
+# Delay between a change in a Flatpak installation and refreshing the installed apps
+INSTALLED_APPS_REFRESH_MS = 500
+
+# Delay between a change in the installed apps or a finished job and accounting the disk usage again
+DISK_USAGE_REFRESH_MS = 2000
+
+# Widget that lists all installed apps and provides options to run or delete them
+class InstalledApps(QWidget):
+    updates_changed = pyqtSignal()
+
+    def __init__(self, job_queue):
+        super(InstalledApps, self).__init__()
+
+        self.job_queue = job_queue
+
+        self.layout = QVBoxLayout()
+        self.setLayout(self.layout)
+
+        # Placeholder shown until the list of installed apps has been loaded, and when it is empty
+        self.placeholder = QLabel("Loading installed apps ...")
+        self.layout.addWidget(self.placeholder)
+
+        # Disk space used by the apps and their runtimes, with a button to free what nothing uses anymore
+        self.usage_label = QLabel()
+        self.usage_label.setStyleSheet("QLabel { color: gray }")
+        self.cleanup_button = QPushButton()
+        self.cleanup_button.clicked.connect(self.cleanup_clicked)
+        self.cleanup_button.setVisible(False)
+        usage_layout = QHBoxLayout()
+        usage_layout.addWidget(self.usage_label)
+        usage_layout.addStretch()
+        usage_layout.addWidget(self.cleanup_button)
+        self.layout.addLayout(usage_layout)
+
+        self.apps = {}  # Details of the listed apps by ID
+        self.widgets = {}  # InstalledApp widgets by ID, in the same order as the layout
+        self.usage = None  # Disk usage of the installations, as returned by disk_usage
+        self.updates = None  # Refs that have updates as returned by check_updates, None until checked or if checking failed
+
+        self.t = None
+        self.pending = False  # Whether another update was requested while one was running
+        self.usage_thread = None
+        self.usage_pending = False
+        self.updates_thread = None
+        self.updates_pending = False
+
+        # Watch the installations, so apps installed or removed from anywhere show up after a short delay
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.installation_changed)
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(INSTALLED_APPS_REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.update)
+        # Walking new deploys would slow down listing the apps, so the disk usage is accounted once things settle
+        self.usage_timer = QTimer(self)
+        self.usage_timer.setSingleShot(True)
+        self.usage_timer.setInterval(DISK_USAGE_REFRESH_MS)
+        self.usage_timer.timeout.connect(self.account_usage)
+        self.watch_installations()
+        get_icon_loader().loaded.connect(self.icon_loaded)
+        # Runtimes and app data aren't watched, so the disk usage is also accounted again after every job, and updates checked
+        self.job_queue.job_finished.connect(self.update_usage)
+        self.job_queue.job_finished.connect(self.check_updates)
+
+    # Slot triggered when an icon is loaded, which is shown if one of the listed apps has it
+    def icon_loaded(self, application_id):
+        widget = self.widgets.get(application_id)
+        if widget is not None:
+            widget.update_icon()
+
+    # Update the list of installed apps in the background
+    def update(self):
+        if self.t is not None:
+            self.pending = True
+            return
+
+        self.t = InstalledAppsThread()
+        self.t.success.connect(self.update_finished)
+        self.t.finished.connect(self.thread_finished)
+        self.t.start()
+
+    # Start the update that was requested while the previous one was running
+    def thread_finished(self):
+        self.t = None
+        if self.pending:
+            self.pending = False
+            self.update()
+
+    # Watch the directories flatpak changes when apps are installed or removed
+    def watch_installations(self):
+        paths = []
+        for installation in (user_installation_path(), system_installation_path()):
+            # The installation itself is watched too, to notice when its app directory gets created
+            for path in (installation, os.path.join(installation, "app"), os.path.join(installation, "exports", "share", "applications")):
+                if os.path.isdir(path) and path not in self.watcher.directories():
+                    paths.append(path)
+        if paths:
+            self.watcher.addPaths(paths)
+
+    # Slot triggered when a watched directory changes, bursts of changes are coalesced into one update
+    def installation_changed(self, path):
+        self.watch_installations()
+        self.refresh_timer.start()
+
+    # Slot to apply the installed apps retrieved by the thread
+    def update_finished(self, installed_apps_json):
+        with profiler.span("apply installed apps"):
+            self.apply_installed_apps(json.loads(installed_apps_json))
+        self.update_usage()
+
+    # Account the disk usage again after a delay, bursts of changes are coalesced into one accounting
+    def update_usage(self, job=None):
+        self.usage_timer.start()
+
+    # Account the disk usage in the background, deploys that were accounted before are read from the cache
+    def account_usage(self):
+        if self.usage_thread is not None:
+            self.usage_pending = True
+            return
+
+        self.usage_thread = DiskUsageThread()
+        self.usage_thread.success.connect(self.usage_finished)
+        self.usage_thread.finished.connect(self.usage_thread_finished)
+        self.usage_thread.start()
+
+    # Start the accounting that was requested while the previous one was running
+    def usage_thread_finished(self):
+        self.usage_thread = None
+        if self.usage_pending:
+            self.usage_pending = False
+            self.account_usage()
+
+    # Slot to show the disk usage accounted by the thread
+    def usage_finished(self, usage_json):
+        self.usage = json.loads(usage_json)
+        self.apply_usage()
+
+    # Show the disk usage of every listed app, counting its extensions like translations in, and the totals of the apps and runtimes
+    def apply_usage(self):
+        if self.usage is None:
+            return
+        refs = self.usage["refs"]
+        for id, widget in self.widgets.items():
+            installation = self.apps[id]["Installation"]
+            owned = [ref for ref in refs if ref["installation"] == installation and (ref["id"] == id or ref["id"].startswith(id + "."))]
+            widget.set_usage(sum(ref["size"] for ref in owned), sum(ref["shared"] for ref in owned))
+
+        runtimes = [ref for ref in refs if ref["kind"] == "runtime"]
+        totals = self.usage["totals"]
+        self.usage_label.setText(f"Apps use {format_size(totals['app'])}, and their {len(runtimes)} runtimes {format_size(totals['runtime'])}")
+        self.usage_label.setToolTip("\n".join(
+            f"{ref['id']} {ref['branch']}: {format_size(ref['size'])}, and {format_size(ref['shared'])} shared{' (unused)' if ref['unused'] else ''}" for ref in runtimes))
+
+        reclaimable = self.usage["unused_size"] + sum(entry["size"] for entry in self.usage["data"])
+        self.cleanup_button.setText(f"Free {format_size(reclaimable)}")
+        self.cleanup_button.setVisible(bool(cleanup_jobs(self.usage)))
+
+    # Check for updates in the background
+    def check_updates(self, job=None):
+        if self.updates_thread is not None:
+            self.updates_pending = True
+            return
+
+        self.updates_thread = UpdatesThread()
+        self.updates_thread.success.connect(self.updates_finished)
+        self.updates_thread.finished.connect(self.updates_thread_finished)
+        self.updates_thread.start()
+
+    # Start the check that was requested while the previous one was running
+    def updates_thread_finished(self):
+        self.updates_thread = None
+        if self.updates_pending:
+            self.updates_pending = False
+            self.check_updates()
+
+    # Slot to mark the apps the check found updates for
+    def updates_finished(self, updates_json):
+        self.updates = json.loads(updates_json)
+        self.apply_updates()
+
+    # Mark the listed apps that have updates in the installation they are listed from
+    def apply_updates(self):
+        download_sizes = {}
+        for update in self.updates or []:
+            if update["kind"] == "app":
+                download_sizes[(update["installation"], update["application_id"])] = update["download_size"]
+        for id, widget in self.widgets.items():
+            widget.set_update(download_sizes.get((self.apps[id]["Installation"], id)))
+        self.updates_changed.emit()
+
+    # Get the jobs updating the selected apps, or every installed app when updates couldn't be checked
+    def update_jobs(self):
+        if self.updates is None:
+            return [FlatpakJob("Updating apps", "update", [])]
+        return update_jobs(self.updates, {id for id, widget in self.widgets.items() if widget.update_skipped()})
+
+    # Describe what the Update button would update and download
+    def updates_summary(self):
+        if self.updates is None:
+            return "Update Apps"
+        jobs = self.update_jobs()
+        if not jobs:
+            return "Up to Date" if not self.updates else "Select Updates"
+        refs = {(job.installation, ref) for job in jobs for ref in job.refs}
+        everything = {job.installation for job in jobs if not job.refs}
+        chosen = [update for update in self.updates if update["installation"] in everything or (update["installation"], update["application_id"]) in refs]
+        apps = sum(1 for update in chosen if update["kind"] == "app")
+        download_size = format_size(sum(update["download_size"] for update in chosen))
+        return f"Update {apps} App{'s' if apps > 1 else ''} ({download_size})" if apps else f"Update Runtimes ({download_size})"
+
+    # Confirm and queue uninstalling the unused runtimes and deleting the data removed apps left behind, in one job per installation
+    def cleanup_clicked(self):
+        unused = [ref for ref in self.usage["refs"] if ref["unused"]]
+        d = QMessageBox()
+        d.setText(f"Uninstall {len(unused)} unused runtimes and delete the data of {len(self.usage['data'])} removed apps?")
+        d.setInformativeText("Flatpak decides which runtimes are unused, and the data of removed apps can't be recovered.")
+        d.setDetailedText("\n".join(
+            [f"Runtime {ref['id']} {ref['branch']} ({ref['installation']}): {format_size(ref['size'])}" for ref in unused]
+            + [f"Data of {entry['id']}: {format_size(entry['size'])}" for entry in self.usage["data"]]))
+        d.setStandardButtons(QMessageBox.Yes | QMessageBox.Cancel)
+        if d.exec_() == QMessageBox.Yes:
+            for job in cleanup_jobs(self.usage):
+                self.job_queue.add(job)
+            self.cleanup_button.setVisible(False)
+
+    # Add and remove the widgets of the apps that changed
+    def apply_installed_apps(self, installed_apps_by_name):
+        installed_apps = {}
+        for app_details in installed_apps_by_name.values():
+            installed_apps[app_details["ID"]] = app_details
+
+        # Remove the apps that are gone, or whose details changed so they get added again
+        for id in list(self.widgets):
+            if installed_apps.get(id) != self.apps[id]:
+                widget = self.widgets.pop(id)
+                self.layout.removeWidget(widget)
+                widget.deleteLater()
+                del self.apps[id]
+
+        # Add the new apps where they belong in the list sorted by name
+        for i, app_details in enumerate(sorted(installed_apps.values(), key=lambda app_details: app_details["Name"])):
+            id = app_details["ID"]
+            if id not in self.widgets:
+                app = InstalledApp(app_details)
+                app.run.connect(self.run_app)
+                app.delete.connect(self.delete_app)
+                app.update_toggled.connect(self.updates_changed)
+                self.layout.insertWidget(i, app)
+                self.widgets[id] = app
+                self.apps[id] = app_details
+
+        self.placeholder.setText("No Flatpak apps are installed yet")
+        self.placeholder.setVisible(len(self.widgets) == 0)
+        self.apply_usage()
+        self.apply_updates()
+
+    # Run the selected app
+    def run_app(self, id):
+        try:
+            get_backend().launch(id, self.apps[id]["Installation"])
+        except FlatpakError as e:
+            print(f"Failed to run {id}: {e}")
+
+    # Queue deleting the selected app, the list is updated when flatpak removes it
+    def delete_app(self, id):
+        print(f"Deleting: {id}")
+        self.job_queue.uninstall(id, self.apps[id]["Installation"])
+
+    # Wait for a running update, so the thread isn't destroyed while running
+    def wait(self):
+        if self.t is not None:
+            self.t.wait()
+        if self.usage_thread is not None:
+            self.usage_thread.wait()
+        if self.updates_thread is not None:
+            self.updates_thread.wait()
+
+# Main window for the Q-Paks application
+class QPaksWindow(QMainWindow):
+    def __init__(self, app):
+        super(QPaksWindow, self).__init__()
+
+        self.app = app
+        self.setWindowTitle("Q-Paks")
+        self.setWindowIcon(QIcon(self.get_icon_path()))
+
+        self.job_queue = JobQueue()
+        self.jobs = JobsWidget(self.job_queue)
+        self.installed_apps = InstalledApps(self.job_queue)
+        self.installed_apps.updates_changed.connect(self.updates_changed)
+        self.search_dialog = None
+
+        self.first_paint_ms = None
+
+        # Shows how old the catalog searched by the search dialog is, and when it is being refreshed
+        self.catalog_label = QLabel()
+        self.catalog_timestamp = None
+        self.catalog_timer = QTimer(self)
+        self.catalog_timer.setInterval(60 * 1000)
+        self.catalog_timer.timeout.connect(self.update_catalog_label)
+        self.appstream_thread = AppstreamThread()
+        self.appstream_thread.status.connect(self.appstream_status)
+
+        self.update_button = QPushButton("Update Apps")
+        self.update_button.clicked.connect(self.update_button_clicked)
+        self.update_button.setEnabled(False)
+        self.install_button = QPushButton("Setting up Flathub ...")
+        self.install_button.clicked.connect(self.install_button_clicked)
+        self.install_button.setEnabled(False)
+
+        # Layout for the buttons at the bottom of the window
+        buttons_layout = QHBoxLayout()
+        buttons_layout.addWidget(self.catalog_label)
+        buttons_layout.addStretch()
+        buttons_layout.addWidget(self.update_button)
+        buttons_layout.addWidget(self.install_button)
+
+        # Layout for the installed apps list and buttons
+        layout = QVBoxLayout()
+        layout.addWidget(self.installed_apps)
+        layout.addStretch()
+        layout.addWidget(self.jobs)
+        layout.addLayout(buttons_layout)
+
+        central_widget = QWidget()
+        central_widget.setLayout(layout)
+        self.setCentralWidget(central_widget)
+
+        self.show()
+
+        # Set up the remotes and load the installed apps once the window is up
+        self.remotes_thread = RemotesThread()
+        self.remotes_thread.finished.connect(self.remotes_ready)
+        self.remotes_thread.start()
+        self.installed_apps.update()
+
+    # Record how long it took for the window to paint for the first time
+    def paintEvent(self, event):
+        if self.first_paint_ms is None:
+            self.first_paint_ms = (time.monotonic() - START_TIME) * 1000
+            print(f"First paint after {self.first_paint_ms:.0f} ms")
+        super(QPaksWindow, self).paintEvent(event)
+
+    # Enable the buttons that need the Flathub remote once it is set up, and refresh its appstream metadata if it's stale
+    def remotes_ready(self):
+        self.update_button.setEnabled(bool(self.installed_apps.update_jobs()))
+        self.install_button.setEnabled(True)
+        self.install_button.setText("Install New App")
+        self.appstream_thread.start()
+
+    # Slot triggered when the appstream metadata starts or stops being refreshed
+    def appstream_status(self, status_json):
+        status = json.loads(status_json)
+        self.catalog_timestamp = status["timestamp"]
+        if status["updating"]:
+            self.catalog_timer.stop()
+            self.catalog_label.setText("Updating the catalog ...")
+        else:
+            self.catalog_timer.start()
+            self.update_catalog_label()
+            # Updates are checked once the appstream data is fresh, and the check is skipped if nothing changed since the last one
+            self.installed_apps.check_updates()
+
+    # Show how long ago the catalog was updated
+    def update_catalog_label(self):
+        if self.catalog_timestamp is None:
+            self.catalog_label.setText("No catalog downloaded yet")
+        else:
+            self.catalog_label.setText(f"Catalog updated {format_age(time.time() - self.catalog_timestamp)}")
+
+    # Wait for the background threads before the window goes away
+    def closeEvent(self, event):
+        if self.job_queue.busy():
+            d = QMessageBox()
+            d.setText("Flatpak jobs are still running. Cancel them and quit?")
+            d.setStandardButtons(QMessageBox.Yes | QMessageBox.Cancel)
+            if d.exec_() != QMessageBox.Yes:
+                event.ignore()
+                return
+            self.job_queue.cancel_all()
+
+        if self.search_dialog is not None:
+            self.search_dialog.done(0)
+        self.remotes_thread.wait()
+        self.appstream_thread.wait()
+        self.installed_apps.wait()
+        get_icon_loader().wait()
+        super(QPaksWindow, self).closeEvent(event)
+
+    # Show what the Update button updates, and disable it when there is nothing to update
+    def updates_changed(self):
+        self.update_button.setText(self.installed_apps.updates_summary())
+        self.update_button.setEnabled(self.install_button.isEnabled() and bool(self.installed_apps.update_jobs()))
+
+    # Queue updating the selected apps when the Update button is clicked, in one job per installation
+    # Until updates have been checked, every installed app is updated
+    def update_button_clicked(self):
+        for job in self.installed_apps.update_jobs():
+            self.job_queue.add(job)
+
+    # Open the search dialog to install new apps when the Install New App button is clicked
+    # The dialog isn't modal, so the installed apps and job progress stay usable while browsing
+    def install_button_clicked(self):
+        if self.search_dialog is None:
+            self.search_dialog = SearchDialog(self.job_queue)
+        self.search_dialog.show()
+        self.search_dialog.raise_()
+        self.search_dialog.activateWindow()
+
+    # Get the path to the application icon
+    def get_icon_path(self):
+        if sys.argv and sys.argv[0].startswith(sys.prefix):
+            prefix = os.path.join(sys.prefix, "share/pixmaps")
+        else:
+            prefix = os.path.join(
+                os.path.dirname(
+                    os.path.abspath(inspect.getfile(inspect.currentframe()))
+                ),
+                "share",
+            )
+        return os.path.join(prefix, "q-paks.png")
+
+# Main function to initialize the application
+def main():
+    def signal_handler(s, frame):
+        print("\nCtrl-C pressed, quitting")
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, signal_handler)
+    profiler.configure(sys.argv)
+
+    app = QApplication(sys.argv)
+    window = QPaksWindow(app)
+    sys.exit(app.exec_())